@@ -1,19 +1,62 @@
-from flask import Flask, render_template, request, session
+from flask import Flask, Response, g, make_response, render_template, request, session, jsonify
+import asyncio
 import os
+import threading
+import time
 from dotenv import load_dotenv
-# ML imports disabled for deployment
-# from data_fetcher import NewsFetcher
-# from models import TopicModeler, CTRPredictor
-# from recommender import Recommender
-# from user_history import UserHistory
+from data_fetcher import article_id as stable_article_id
+import metrics
+from response_cache import ResponseCache
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_secret_key')
 
+metrics.describe('http_request_seconds', "Request latency by endpoint")
+metrics.describe('render_seconds', "Template rendering latency")
+
+# Opt-in: PROFILE_SLOW_MS=500 profiles PROFILE_SAMPLE_RATE of requests and dumps the slow ones
+request_profiler = None
+if os.environ.get('PROFILE_SLOW_MS'):
+    request_profiler = metrics.RequestProfiler(
+        threshold=float(os.environ['PROFILE_SLOW_MS']) / 1000,
+        sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01)),
+        out_dir=os.environ.get('PROFILE_DIR', 'profiles'))
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled or request_profiler:
+        g.request_started = time.perf_counter()
+        g.profile = request_profiler.start() if request_profiler else None
+
+@app.teardown_request
+def record_request_time(exc):
+    # Teardown also runs when the view raised, which after_request does not: a profile left enabled
+    # would make every later start() on this thread fail
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unknown'
+        if metrics.enabled:
+            metrics.observe('http_request_seconds', elapsed, endpoint=endpoint)
+        profile = g.pop('profile', None)
+        if profile is not None:
+            request_profiler.stop(profile, elapsed, endpoint)
+
+def render(template, **context):
+    with metrics.timer('render_seconds', template=template):
+        return render_template(template, **context)
+
+def feed_response(entry):
+    """Cached home page with an ETag, or 304 when the browser already has it"""
+    response = make_response(entry.html)
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 def get_mock_articles():
-    return [
+    articles = [
         {
             "title": "AI Advances in Healthcare",
             "description": "New AI models are revolutionizing medical diagnostics.",
@@ -39,53 +82,182 @@ def get_mock_articles():
             "source": {"name": "Finance Today"}
         }
     ]
+    for article in articles:
+        article['id'] = stable_article_id(article)
+    return articles
+
+mock_articles_by_id = {a['id']: a for a in get_mock_articles()}
+
+def find_article(article_id, snapshot=None):
+    """O(1) lookup by stable ID: current pool snapshot, then articles kept with user history"""
+    article = None
+    if ml_enabled and article_pool:
+        try:
+            article = (snapshot or article_pool.get()).by_id.get(article_id)
+        except Exception as e:
+            print(f"News API failed: {e}, using mock data")
+        if article is None and user_history:
+            article = user_history.get_article(article_id)
+    return article or mock_articles_by_id.get(article_id)
 
 # Initialize ML components with error handling
+news_fetcher = None
+article_pool = None
+topic_modeler = None
+ctr_predictor = None
+user_history = None
+recommender = None
+training_worker = None
+feed_cache = None
+response_cache = None
+ml_enabled = False
 try:
-    # Temporarily disable ML for deployment
-    news_fetcher = None
-    topic_modeler = None
-    ctr_predictor = None
-    user_history = None
-    recommender = None
-    ml_enabled = False
-    print("ML components disabled for deployment")
+    # ML stays disabled for deployment unless ML_ENABLED=1
+    if os.environ.get('ML_ENABLED') == '1':
+        from article_pool import ArticlePool
+        from candidate_index import CandidateIndex
+        from data_fetcher import NewsFetcher
+        from feature_store import ArticleFeatureStore
+        from feed_cache import FeedCache
+        from models import TopicModeler, CTRPredictor
+        from near_duplicates import NearDuplicateIndex
+        from recommender import Recommender
+        from training_worker import TrainingWorker
+        from sqlite_history import SQLiteUserHistory
+        from user_history import UserHistory
+
+        news_fetcher = NewsFetcher(os.environ.get('NEWS_API_KEY'), os.environ.get('NEWS_API_URL'))
+        news_queries = os.environ.get('NEWS_QUERIES', 'technology').split(',')
+        news_pages = int(os.environ.get('NEWS_PAGES', 1))
+        # Syndicated copies of a story collapse into one article carrying the copy count
+        near_duplicates = NearDuplicateIndex(threshold=float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.5)))
+        async def fetch_pool_async():
+            articles = await news_fetcher.ingest_async(news_queries, pages=news_pages)
+            return await asyncio.to_thread(near_duplicates.dedupe, articles)
+
+        # Requests read a cached snapshot; NewsAPI is only hit when it goes stale
+        article_pool = ArticlePool(
+            lambda: near_duplicates.dedupe(news_fetcher.ingest(news_queries, pages=news_pages)),
+            ttl=float(os.environ.get('ARTICLE_POOL_TTL', 300)),
+            max_stale=float(os.environ.get('ARTICLE_POOL_MAX_STALE', 3600)),
+            fetch_async=fetch_pool_async)  # Used by the ASGI app (asgi.py)
+        topic_modeler = TopicModeler()
+        # Keywords must exist before UserHistory replays clicks into topic profiles
+        topic_modeler.fit([])
+        topic_modeler.load_model()
+        ctr_predictor = CTRPredictor()
+        # Least recently used articles are evicted past this many; keep it above the pool size
+        feature_store = ArticleFeatureStore(topic_modeler,
+                                            max_articles=int(os.environ.get('FEATURE_STORE_SIZE', 50000)))
+        if os.environ.get('HISTORY_BACKEND') == 'sqlite':
+            # Shared by every worker process; the JSON backend is only safe with a single process
+            user_history = SQLiteUserHistory(os.environ.get('HISTORY_DB', 'user_data.db'),
+                                             feature_store=feature_store)
+        else:
+            user_history = UserHistory(feature_store=feature_store)
+        # Large pools go through an inverted index first; only its top NUM_CANDIDATES are ranked. Pools up to
+        # it are ranked whole. Posting lists are ordered by recency and by the serving CTR model's article-only
+        # score, re-scored on each refresh; in bench_candidates 2000 kept all of the exhaustive top 10 at 10k
+        # articles (NEWS_QUERIES x NEWS_PAGES x 100 at most) and 97% of it at 100k
+        candidate_index = CandidateIndex(
+            feature_store, prior=lambda articles, topics: recommender.ctr_predictor.article_prior(articles, topics))
+        article_pool.on_refresh(lambda snapshot: candidate_index.sync(snapshot.articles))
+        recommender = Recommender(topic_modeler, ctr_predictor, user_history, candidate_index=candidate_index,
+                                  num_candidates=int(os.environ.get('NUM_CANDIDATES', 2000)))
+        # Clicks and views are applied to history and the CTR model off the request path
+        training_worker = TrainingWorker(
+            user_history, ctr_predictor,
+            batch_size=int(os.environ.get('TRAINING_BATCH_SIZE', 100)),
+            flush_interval=float(os.environ.get('TRAINING_FLUSH_SECONDS', 5)))
+        training_worker.on_model_update(lambda model: setattr(recommender, 'ctr_predictor', model))
+        # Feeds precomputed by batch_feeds.py, served until the user interacts or too few are left in the pool
+        feed_cache = FeedCache(os.environ.get('FEED_CACHE', 'feed_cache.json'))
+        # Rendered home pages per user, served until the pool is refreshed or the user interacts, in any
+        # worker: entries are keyed on the history length the workers share
+        response_cache = ResponseCache(
+            max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', 10000)),
+            max_bytes=int(float(os.environ.get('RESPONSE_CACHE_MB', 64)) * 1024 * 1024))
+        article_pool.on_refresh(lambda snapshot: response_cache.clear())
+        ml_enabled = True
+        print("ML components enabled")
+    else:
+        print("ML components disabled for deployment")
 except Exception as e:
     print(f"ML initialization failed: {e}, running without ML")
     ml_enabled = False
     news_fetcher = None
+    article_pool = None
     recommender = None
+    training_worker = None
 
-# Load or train models
-try:
-    topic_modeler.load_model()
-    print("Topic model loaded successfully")
-except Exception as e:
-    print(f"Topic model loading failed: {e}")
-    # Train on demo data if models don't exist
-    demo_articles = [
-        {"title": "AI in Healthcare", "content": "AI technology healthcare medical diagnosis"},
-        {"title": "Climate Change", "content": "climate environment global warming carbon"},
-        {"title": "Stock Market", "content": "finance stocks trading investment market"}
-    ]
-    try:
-        topic_modeler.train(demo_articles)
-        topic_modeler.save_model()
-        print("Topic model trained and saved")
-    except Exception as e:
-        print(f"Topic model training failed: {e}")
+warm_lock = threading.Lock()
+warmed_up = False
 
-try:
-    ctr_predictor.load_model()
-    print("CTR model loaded successfully")
-except Exception as e:
-    print(f"CTR model loading failed: {e}")
-    try:
-        ctr_predictor.train(demo_articles)
-        ctr_predictor.save_model()
-        print("CTR model trained and saved")
-    except Exception as e:
-        print(f"CTR model training failed: {e}")
+def warm_up():
+    """Load models and prime caches before taking traffic; run by __main__ or a server hook, else by the first request"""
+    global warmed_up, ctr_predictor
+    with warm_lock:
+        if warmed_up:
+            return
+        try:
+            if not ml_enabled:
+                return
+            try:
+                # Loaded into a fresh model and swapped in by reference, as the training worker swaps models, so
+                # a request scoring meanwhile never sees a half-loaded one. Memory-mapped, so workers share the weights
+                loaded = CTRPredictor()
+                loaded.load_model()
+                ctr_predictor = recommender.ctr_predictor = training_worker.model = loaded
+                print("CTR model loaded successfully")
+            except Exception as e:
+                print(f"CTR model loading failed: {e}, starting untrained")
+            # Started after loading so the worker trains on top of the saved model
+            training_worker.start()
+            try:
+                # First ranking imports sklearn and fills the feature store, candidate index and CTR feature cache
+                recommender.recommend('warm-up', article_pool.get().articles)
+                print("Warm-up complete")
+            except Exception as e:
+                print(f"Warm-up ranking failed: {e}")
+        finally:
+            # Only now, so requests arriving meanwhile wait in ensure_warm for the loaded model
+            warmed_up = True
+
+@app.before_request
+def ensure_warm():
+    if not warmed_up:
+        warm_up()
+
+def rank_feed(user_id, articles, snapshot):
+    """The user's top 10 of articles, precomputed or ranked now; ranked is False when shown unranked"""
+    ranked = False
+    if ml_enabled and recommender:
+        try:
+            cached = None
+            if feed_cache and snapshot:
+                cached = feed_cache.get(user_id, user_history.history_length(user_id), snapshot.by_id)
+            if cached is not None:
+                articles = cached
+                print(f"Served {len(articles)} precomputed recommendations")
+            else:
+                recommended_articles = recommender.recommend(user_id, articles)
+                articles = recommended_articles[:10]  # Show top 10
+                print(f"Generated {len(articles)} personalized recommendations")
+            ranked = True
+        except Exception as e:
+            print(f"Recommendation failed: {e}, showing all articles")
+            # If recommendation fails, show all articles
+            pass
+    else:
+        print("Skipping recommendations (ML disabled)")
+        articles = articles[:10]  # Show first 10
+    return articles, ranked
+
+def profile_data(user_id):
+    stats = user_history.stats(user_id)
+    # Only the last page of history is read
+    recent = user_history.get_history(user_id, limit=10, offset=max(user_history.history_length(user_id) - 10, 0))
+    return stats, recent
 
 @app.route('/')
 def home():
@@ -95,10 +267,12 @@ def home():
     user_id = session['user_id']
 
     # Get news articles
-    if ml_enabled and news_fetcher:
+    snapshot = None
+    if ml_enabled and article_pool:
         try:
-            articles = news_fetcher.get_news()
-            print(f"Fetched {len(articles)} articles from API")
+            snapshot = article_pool.get()
+            articles = snapshot.articles  # The synced pool itself, so the candidate index needs no filtering
+            print(f"Fetched {len(articles)} articles from article pool")
         except Exception as e:
             print(f"News API failed: {e}, using mock data")
             articles = get_mock_articles()
@@ -106,81 +280,71 @@ def home():
         print("Using mock data (ML disabled)")
         articles = get_mock_articles()
 
-    # Get personalized recommendations
-    if ml_enabled and recommender:
-        try:
-            recommended_articles = recommender.recommend(user_id, articles, user_history)
-            articles = recommended_articles[:10]  # Show top 10
-            print(f"Generated {len(articles)} personalized recommendations")
-        except Exception as e:
-            print(f"Recommendation failed: {e}, showing all articles")
-            # If recommendation fails, show all articles
-            pass
-    else:
-        print("Skipping recommendations (ML disabled)")
-        articles = articles[:10]  # Show first 10
+    # Nothing changed for this user since the page was last rendered: serve it again
+    history_len = None
+    if response_cache and snapshot:
+        # Read before ranking: an interaction applied meanwhile leaves the new page already out of date
+        history_len = user_history.history_length(user_id)
+        entry = response_cache.get(user_id, snapshot.version, history_len)
+        if entry is not None:
+            return feed_response(entry)
+
+    articles, ranked = rank_feed(user_id, articles, snapshot)
 
-    return render_template('index.html', articles=articles, user_id=user_id, ml_enabled=ml_enabled)
+    html = render('index.html', articles=articles, user_id=user_id, ml_enabled=ml_enabled)
+    if response_cache and snapshot and ranked:
+        return feed_response(response_cache.put(user_id, snapshot.version, history_len,
+                                                [a['id'] for a in articles], html))
+    return html
 
-@app.route('/view/<int:article_id>')
+@app.route('/view/<article_id>')
 def view(article_id):
     user_id = session.get('user_id', 'anonymous')
 
-    # Get articles (same logic as home)
-    if ml_enabled and news_fetcher:
-        try:
-            articles = news_fetcher.get_news()
-        except:
-            articles = get_mock_articles()
-    else:
-        articles = get_mock_articles()
+    article = find_article(article_id)
+    if article is None:
+        return "Article not found", 404
 
-    if 0 <= article_id < len(articles):
-        article = articles[article_id]
+    # Track user interaction (only if ML enabled)
+    if ml_enabled and training_worker:
+        training_worker.submit(user_id, article_id, clicked=False, article_data=article)
 
-        # Track user interaction (only if ML enabled)
-        if ml_enabled and user_history:
-            try:
-                user_history.add_interaction(user_id, article_id, 'view')
-            except:
-                pass
+    return render('article.html', article=article)
 
-        return render_template('article.html', article=article)
-    else:
-        return "Article not found", 404
-
-@app.route('/click/<int:article_id>')
+@app.route('/click/<article_id>')
 def click(article_id):
     user_id = session.get('user_id', 'anonymous')
 
-    # Track click interaction (only if ML enabled)
-    if ml_enabled and user_history:
-        try:
-            user_history.add_interaction(user_id, article_id, 'click')
-        except:
-            pass
+    article = find_article(article_id)
+    if article is None:
+        return "Article not found", 404
 
-        # Update CTR predictor with new data
-        if ctr_predictor:
-            try:
-                ctr_predictor.update_model(user_history.get_training_data())
-                ctr_predictor.save_model()
-            except:
-                pass
+    # Track click interaction (only if ML enabled); history and CTR updates happen in the background
+    if ml_enabled and training_worker:
+        training_worker.submit(user_id, article_id, clicked=True, article_data=article)
 
     return f'<h1>Article {article_id} clicked!</h1><a href="/">Back to Feed</a>'
 
 @app.route('/profile')
 def profile():
     user_id = session.get('user_id', 'anonymous')
-    history = user_history.get_history(user_id)
-    stats = {
-        'total_views': len([h for h in history if not h['clicked']]),
-        'total_clicks': len([h for h in history if h['clicked']]),
-        'unique_articles': len(set(h['article_id'] for h in history))
-    }
-    return render_template('profile.html', history=history[-10:], stats=stats, user_id=user_id)
+    stats, recent = profile_data(user_id)
+    return render('profile.html', history=recent, stats=stats, user_id=user_id)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'ml_enabled': ml_enabled,
+        'article_pool': article_pool.stats() if article_pool else None,
+        'training_worker': training_worker.stats() if training_worker else None,
+        'response_cache': response_cache.stats() if response_cache else None,
+    })
 
 if __name__ == '__main__':
+    warm_up()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,163 @@
+import asyncio
+from collections import namedtuple
+import hashlib
+import threading
+import time
+from types import MappingProxyType
+
+from data_fetcher import article_id
+
+# articles is a tuple shared by every reader and by_id indexes it by stable article ID;
+# treat the article dicts as read-only.
+PoolSnapshot = namedtuple('PoolSnapshot', 'version articles fetched_at by_id')
+
+
+def pool_fingerprint(articles):
+    """Identifies an article set, so batch_feeds.py can tell whether it changed since the last run"""
+    return hashlib.sha1(' '.join(sorted(article_id(a) for a in articles)).encode('utf-8')).hexdigest()
+
+
+class ArticlePool:
+    """TTL-cached article snapshot with stale-while-revalidate background refresh"""
+
+    def __init__(self, fetch, ttl=300, max_stale=3600, fetch_async=None):
+        self.fetch = fetch  # Callable returning a list of articles, e.g. NewsFetcher.fetch_news
+        self.fetch_async = fetch_async  # Coroutine function used by get_async, e.g. NewsFetcher.ingest_async
+        self.ttl = ttl
+        self.max_stale = max_stale  # Older snapshots are refetched before being served
+        self.snapshot = None  # Replaced wholesale, so readers never need the lock
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._inflight = None  # Event set when the running upstream fetch finishes
+        self._task = None  # Task running the latest upstream fetch started by refresh_async
+        self._listeners = []
+
+    def on_refresh(self, callback):
+        """Register callback(snapshot), called on the fetching thread once each new snapshot is served"""
+        self._listeners.append(callback)
+
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is not None:
+            age = time.time() - snapshot.fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                return snapshot
+            if age < self.max_stale:
+                self.stale_hits += 1
+                self.refresh(wait=False)
+                return snapshot
+        self.misses += 1
+        self.refresh(wait=True)
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise RuntimeError("Article pool is empty: upstream fetch failed")
+        return snapshot
+
+    async def get_async(self):
+        """get() for an event loop: the upstream fetch is awaited rather than holding a thread"""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            age = time.time() - snapshot.fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                return snapshot
+            if age < self.max_stale:
+                self.stale_hits += 1
+                self._start_fetch_task()
+                return snapshot
+        self.misses += 1
+        await self.refresh_async()
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise RuntimeError("Article pool is empty: upstream fetch failed")
+        return snapshot
+
+    async def refresh_async(self):
+        """refresh() as a coroutine; shares the single upstream fetch with threads and other tasks"""
+        inflight, task = self._start_fetch_task()
+        if task is not None and not task.done():
+            # Requests awaiting the fetch may be cancelled on disconnect; the fetch itself carries on
+            await asyncio.shield(task)
+        elif not inflight.is_set():
+            await asyncio.to_thread(inflight.wait)  # Started by a thread calling refresh()
+
+    def _start_fetch_task(self):
+        with self._lock:
+            if self._inflight is None:
+                self._inflight = threading.Event()
+                self._task = asyncio.ensure_future(self._fetch_async(self._inflight))
+            return self._inflight, self._task
+
+    def refresh(self, wait=True):
+        """Fetch a new snapshot; concurrent callers share a single upstream fetch"""
+        with self._lock:
+            inflight = self._inflight
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight = threading.Event()
+        if leader:
+            if wait:
+                self._fetch(inflight)
+            else:
+                threading.Thread(target=self._fetch, args=(inflight,), daemon=True).start()
+        elif wait:
+            inflight.wait()
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            'version': snapshot.version if snapshot else 0,
+            'articles': len(snapshot.articles) if snapshot else 0,
+            'age_seconds': time.time() - snapshot.fetched_at if snapshot else None,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+        }
+
+    def _fetch(self, inflight):
+        try:
+            self._publish(self.fetch())
+        except Exception as e:
+            self.errors += 1
+            print(f"Article pool refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._inflight = None
+            inflight.set()
+
+    async def _fetch_async(self, inflight):
+        try:
+            if self.fetch_async is None:
+                articles = await asyncio.to_thread(self.fetch)
+            else:
+                articles = await self.fetch_async()
+            # Listeners index the new articles, which is CPU work best kept off the event loop
+            await asyncio.to_thread(self._publish, articles)
+        except Exception as e:
+            self.errors += 1
+            print(f"Article pool refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._inflight = None
+            inflight.set()
+
+    def _publish(self, fetched):
+        articles = tuple(a if a.get('id') else dict(a, id=article_id(a)) for a in fetched)
+        by_id = MappingProxyType({a['id']: a for a in articles})
+        version = self.snapshot.version + 1 if self.snapshot else 1
+        snapshot = PoolSnapshot(version, articles, time.time(), by_id)
+        self.snapshot = snapshot
+        self.refreshes += 1
+        # A failing listener must not cost the refresh or the listeners after it
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Article pool refresh listener failed: {e}")
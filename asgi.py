@@ -0,0 +1,166 @@
+"""Async (ASGI) serving mode: the routes of app.py on Quart, sharing its components and configuration.
+
+Run with: hypercorn asgi:app --bind 0.0.0.0:5000 (or uvicorn asgi:app)
+Article pool fetches are awaited with an async HTTP client, so a slow NewsAPI does not hold a worker;
+ranking and history reads, which are CPU or disk bound, run on a thread pool (RANKING_THREADS).
+PROFILE_SLOW_MS profiles that thread-pool work per request, as cProfile only sees its own thread.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from quart import Quart, g, jsonify, make_response, render_template, request, session
+
+import app as shared
+import metrics
+
+app = Quart(__name__)
+app.secret_key = shared.app.secret_key  # Session cookies work across both apps
+
+ranking_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('RANKING_THREADS', os.cpu_count() or 4)),
+                                      thread_name_prefix='ranking')
+
+async def run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    if shared.request_profiler:
+        return await loop.run_in_executor(ranking_executor, profiled, request.endpoint or 'unknown', func, *args)
+    return await loop.run_in_executor(ranking_executor, func, *args)
+
+def profiled(name, func, *args):
+    """func(*args) under the request profiler when it samples this call, on the thread that runs it
+
+    Profiling the event loop instead would mix in every request interleaved with this one.
+    """
+    profile = shared.request_profiler.start()
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        if profile is not None:
+            shared.request_profiler.stop(profile, time.perf_counter() - started, name)
+
+@app.before_serving
+async def warm_up():
+    await asyncio.to_thread(shared.warm_up)
+
+@app.after_serving
+async def shutdown():
+    if shared.news_fetcher:
+        await shared.news_fetcher.aclose()
+    ranking_executor.shutdown(wait=False)
+
+@app.before_request
+async def start_request_timer():
+    if not shared.warmed_up:
+        await asyncio.to_thread(shared.warm_up)
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def record_request_time(response):
+    if metrics.enabled:
+        metrics.observe('http_request_seconds', time.perf_counter() - g.request_started,
+                        endpoint=request.endpoint or 'unknown')
+    return response
+
+async def render(template, **context):
+    with metrics.timer('render_seconds', template=template):
+        return await render_template(template, **context)
+
+async def feed_response(entry):
+    response = await make_response(entry.html)
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return await response.make_conditional(request)
+
+async def pool_snapshot():
+    """Current article pool snapshot, awaiting NewsAPI if it has to be fetched; None without ML or on failure"""
+    if not (shared.ml_enabled and shared.article_pool):
+        return None
+    try:
+        return await shared.article_pool.get_async()
+    except Exception as e:
+        print(f"News API failed: {e}, using mock data")
+        return None
+
+async def find_article(article_id):
+    snapshot = await pool_snapshot()
+    article = snapshot.by_id.get(article_id) if snapshot else None
+    if article is not None or not shared.ml_enabled:
+        return article or shared.mock_articles_by_id.get(article_id)
+    # The fallbacks may block (the history lookup is a SQLite query on that backend), so keep them off the event loop
+    return await run_blocking(shared.find_article, article_id, snapshot)
+
+@app.route('/')
+async def home():
+    if 'user_id' not in session:
+        session['user_id'] = 'user_' + str(hash(request.remote_addr or 'default') % 1000)
+
+    user_id = session['user_id']
+
+    snapshot = await pool_snapshot()
+    articles = snapshot.articles if snapshot else shared.get_mock_articles()
+
+    history_len = None
+    if shared.response_cache and snapshot:
+        history_len = await run_blocking(shared.user_history.history_length, user_id)
+        entry = shared.response_cache.get(user_id, snapshot.version, history_len)
+        if entry is not None:
+            return await feed_response(entry)
+
+    articles, ranked = await run_blocking(shared.rank_feed, user_id, articles, snapshot)
+
+    html = await render('index.html', articles=articles, user_id=user_id, ml_enabled=shared.ml_enabled)
+    if shared.response_cache and snapshot and ranked:
+        entry = shared.response_cache.put(user_id, snapshot.version, history_len, [a['id'] for a in articles], html)
+        return await feed_response(entry)
+    return html
+
+@app.route('/view/<article_id>')
+async def view(article_id):
+    user_id = session.get('user_id', 'anonymous')
+
+    article = await find_article(article_id)
+    if article is None:
+        return "Article not found", 404
+
+    if shared.ml_enabled and shared.training_worker:
+        shared.training_worker.submit(user_id, article_id, clicked=False, article_data=article)
+
+    return await render('article.html', article=article)
+
+@app.route('/click/<article_id>')
+async def click(article_id):
+    user_id = session.get('user_id', 'anonymous')
+
+    article = await find_article(article_id)
+    if article is None:
+        return "Article not found", 404
+
+    if shared.ml_enabled and shared.training_worker:
+        shared.training_worker.submit(user_id, article_id, clicked=True, article_data=article)
+
+    return f'<h1>Article {article_id} clicked!</h1><a href="/">Back to Feed</a>'
+
+@app.route('/profile')
+async def profile():
+    user_id = session.get('user_id', 'anonymous')
+    stats, recent = await run_blocking(shared.profile_data, user_id)
+    return await render('profile.html', history=recent, stats=stats, user_id=user_id)
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+@app.route('/stats')
+async def stats():
+    return jsonify({
+        'ml_enabled': shared.ml_enabled,
+        'article_pool': shared.article_pool.stats() if shared.article_pool else None,
+        'training_worker': shared.training_worker.stats() if shared.training_worker else None,
+        'response_cache': shared.response_cache.stats() if shared.response_cache else None,
+    })
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    app.run(host='0.0.0.0', port=port)
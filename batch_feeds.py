@@ -0,0 +1,120 @@
+"""Precompute personalized feeds for every known user, in parallel, into the feed cache.
+
+Run with: python batch_feeds.py --workers 8
+Only users who interacted since the last run, or every user after the article pool changed,
+are ranked again. home() serves a user's feed until they interact again, restricted to the
+articles still in the app's own pool.
+"""
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+
+from dotenv import load_dotenv
+
+from article_pool import pool_fingerprint
+from data_fetcher import NewsFetcher, article_id
+from feature_store import ArticleFeatureStore
+from feed_cache import FeedCache
+from models import CTRPredictor, TopicModeler
+from near_duplicates import NearDuplicateIndex
+from recommender import Recommender
+from sqlite_history import SQLiteUserHistory
+from user_history import UserHistory
+
+# Set in the parent before the pool starts; forked workers inherit it, so the feature matrices,
+# CTR feature cache and model weights are shared copy-on-write instead of pickled per task
+_job = None
+
+
+def _rank(user_ids):
+    recommender, articles, num_recommendations = _job
+    feeds = recommender.recommend_many(user_ids, articles, num_recommendations)
+    return [(user_id, [article_id(a) for a in feed]) for user_id, feed in feeds.items()]
+
+
+def build(data_file, model_path):
+    topic_modeler = TopicModeler()
+    topic_modeler.fit([])
+    topic_modeler.load_model()
+    ctr_predictor = CTRPredictor()
+    ctr_predictor.load_model(model_path)
+    feature_store = ArticleFeatureStore(topic_modeler)
+    if os.environ.get('HISTORY_BACKEND') == 'sqlite':
+        user_history = SQLiteUserHistory(os.environ.get('HISTORY_DB', 'user_data.db'), feature_store=feature_store)
+    else:
+        # The app owns the snapshot and log: compacting them from here would drop its newer events
+        user_history = UserHistory(data_file=data_file, feature_store=feature_store, read_only=True)
+    # recommend_many scores the whole pool rather than the candidate index's picks. For pools larger than
+    # NUM_CANDIDATES the cached feeds are therefore intentionally the exhaustive ranking, which the app's
+    # live two-stage recommend() only approximates; up to it the two are identical
+    return Recommender(topic_modeler, ctr_predictor, user_history,
+                       num_candidates=int(os.environ.get('NUM_CANDIDATES', 2000)))
+
+
+def run(recommender, articles, feed_cache, workers=None, num_recommendations=10, full=False):
+    """Rank stale users against articles and save the cache; returns (users ranked, seconds)"""
+    global _job
+    workers = workers or os.cpu_count()
+    fingerprint = pool_fingerprint(articles)
+    feed_cache.reload()
+    lengths = recommender.user_history.history_lengths()
+    if full or feed_cache.pool_fingerprint != fingerprint:
+        feeds = {}
+        stale = list(lengths)
+    else:
+        feeds = dict(feed_cache.feeds)
+        stale = [user for user, n in lengths.items()
+                 if user not in feeds or feeds[user]['history_len'] != n]
+
+    start = time.perf_counter()
+    # Everything the workers read is built once here, before forking
+    recommender.feature_store.tfidf(articles)
+    recommender.ctr_predictor.predict_proba(articles)  # Warm the CTR feature cache
+    _job = (recommender, articles, num_recommendations)
+    try:
+        if stale:
+            # Users go out in chunks, each ranked by one batched recommend_many call
+            chunk_size = max(1, -(-len(stale) // (4 * workers)))
+            chunks = [stale[i:i + chunk_size] for i in range(0, len(stale), chunk_size)]
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                for ranked in executor.map(_rank, chunks):
+                    for user_id, article_ids in ranked:
+                        feeds[user_id] = {'history_len': lengths[user_id], 'article_ids': article_ids}
+    finally:
+        _job = None
+    elapsed = time.perf_counter() - start
+    feed_cache.save(fingerprint, feeds)
+    return len(stale), elapsed
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument('--top-n', type=int, default=20,
+                        help="articles kept per user; the app shows the first 10 still in its pool")
+    parser.add_argument('--data-file', default='user_data.json')
+    parser.add_argument('--model', default='models/ctr_model')
+    parser.add_argument('--cache', default=os.environ.get('FEED_CACHE', 'feed_cache.json'))
+    parser.add_argument('--full', action='store_true', help="rank every user, not just stale ones")
+    args = parser.parse_args()
+
+    recommender = build(args.data_file, args.model)
+    news_fetcher = NewsFetcher(os.environ.get('NEWS_API_KEY'), os.environ.get('NEWS_API_URL'))
+    articles = news_fetcher.ingest(os.environ.get('NEWS_QUERIES', 'technology').split(','),
+                                   pages=int(os.environ.get('NEWS_PAGES', 1)))
+    # Same ingestion steps as the app. The app's index keeps LSH clusters across refreshes and this one
+    # starts empty, so the pools can differ; the app serves cached feeds by overlap, not by fingerprint
+    articles = NearDuplicateIndex(threshold=float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.5))).dedupe(articles)
+    print(f"Ranking against {len(articles)} articles")
+
+    ranked, elapsed = run(recommender, articles, FeedCache(args.cache), args.workers, args.top_n, args.full)
+    recommender.user_history.close()
+    rate = ranked / elapsed if elapsed else 0.0
+    print(f"Ranked {ranked} users in {elapsed:.2f}s ({rate:.0f} users/s) with {args.workers or os.cpu_count()} workers")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""ArticlePool vs a NewsAPI round trip per request, against the local mock NewsAPI.
+
+Run with: python -m benchmarks.bench_article_pool --latency 0.2 --requests 200 --threads 20
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from article_pool import ArticlePool
+from benchmarks.mock_newsapi import MockNewsAPI
+from data_fetcher import NewsFetcher
+
+
+def run_requests(get_articles, requests, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: get_articles(), range(requests)))
+    return time.perf_counter() - start
+
+
+def run(latency, requests, threads, ttl):
+    with MockNewsAPI(latency=latency) as api:
+        fetcher = NewsFetcher(api_key='test', base_url=api.url)
+
+        elapsed = run_requests(fetcher.fetch_news, requests, threads)
+        print(f"direct fetch: {requests} requests in {elapsed:.3f}s, {api.requests} upstream calls")
+
+        api.requests = 0
+        article_pool = ArticlePool(fetcher.fetch_news, ttl=ttl)
+        elapsed = run_requests(lambda: article_pool.get().articles, requests, threads)
+        print(f"article pool: {requests} requests in {elapsed:.3f}s, {api.requests} upstream calls")
+        print(f"pool stats:   {article_pool.stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=20)
+    parser.add_argument('--ttl', type=float, default=300)
+    args = parser.parse_args()
+    run(args.latency, args.requests, args.threads, args.ttl)
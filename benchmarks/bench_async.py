@@ -0,0 +1,109 @@
+"""Load test of the home page on one sync Flask worker vs one async (ASGI) worker, against a slow NewsAPI.
+
+Run with: python -m benchmarks.bench_async --latency 0.2 --concurrency 1 4 16 64 --duration 10
+The pool is set to expire immediately so every request waits on the upstream fetch, as on a cold or
+expired pool. A sync worker serves one request at a time, each waiting out its own fetch; the async
+worker keeps accepting requests while a fetch is in flight and they all share it.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.generators import generate_articles
+from benchmarks.mock_newsapi import MockNewsAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    # One request at a time, like a gunicorn sync worker
+    'flask': [sys.executable, '-c', "import sys, app; from werkzeug.serving import make_server; app.warm_up(); "
+                                    "make_server('127.0.0.1', int(sys.argv[1]), app.app, threaded=False).serve_forever()"],
+    'asgi': [sys.executable, '-m', 'hypercorn', 'asgi:app', '--workers', '1', '--bind'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, env, workdir):
+    command = SERVERS[mode] + ([str(port)] if mode == 'flask' else [f'127.0.0.1:{port}'])
+    proc = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/', timeout=30).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+async def load(url, concurrency, duration):
+    """concurrency clients requesting url back to back for duration seconds; latencies, errors, wall time"""
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    stop = started + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        async def user():
+            nonlocal errors
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                response = await client.get(url)
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+        await asyncio.gather(*[user() for _ in range(concurrency)])
+    return latencies, errors, time.perf_counter() - started
+
+
+def run(modes, concurrency_levels, latency, duration, n_articles, seed):
+    articles = generate_articles(n_articles, seed=seed)
+    print(f"{'server':<7} {'clients':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'upstream':>9}")
+    with MockNewsAPI(latency=latency, corpus=articles) as api:
+        for mode in modes:
+            workdir = tempfile.mkdtemp(prefix='bench_async_')
+            env = dict(os.environ, ML_ENABLED='1', NEWS_API_URL=api.url, NEWS_API_KEY='bench',
+                       NEWS_PAGES=str(-(-n_articles // 100)), ARTICLE_POOL_TTL='0', ARTICLE_POOL_MAX_STALE='0',
+                       RESPONSE_CACHE_SIZE='0', PYTHONPATH=ROOT)
+            port = free_port()
+            proc = start_server(mode, port, env, workdir)
+            try:
+                for concurrency in concurrency_levels:
+                    upstream = api.requests
+                    latencies, errors, elapsed = asyncio.run(
+                        load(f'http://127.0.0.1:{port}/', concurrency, duration))
+                    p50, p95 = np.percentile(latencies, [50, 95]) * 1000 if latencies else (0, 0)
+                    print(f"{mode:<7} {concurrency:>8} {len(latencies) / elapsed:>8.1f} {p50:>8.0f} {p95:>8.0f} "
+                          f"{errors:>7} {api.requests - upstream:>9}")
+            finally:
+                proc.terminate()
+                proc.wait()
+                shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=['flask', 'asgi'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds the stub NewsAPI takes per page")
+    parser.add_argument('--duration', type=float, default=10, help="seconds per concurrency level")
+    parser.add_argument('--articles', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.modes, args.concurrency, args.latency, args.duration, args.articles, args.seed)
@@ -0,0 +1,65 @@
+"""Batch feed precomputation throughput (users/s) by worker count, plus an incremental rerun.
+
+Run with: python -m benchmarks.bench_batch_feeds --users 2000 --articles 1000 --workers 1 2 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import batch_feeds
+from benchmarks.generators import TOPIC_VOCAB, generate_articles, generate_histories
+from candidate_index import CandidateIndex
+from feature_store import ArticleFeatureStore
+from feed_cache import FeedCache
+from models import CTRPredictor, TopicModeler
+from recommender import Recommender
+from user_history import UserHistory
+
+
+def run(n_users, n_articles, events_per_user, workers, changed, seed):
+    rng = np.random.default_rng(seed)
+    workdir = tempfile.mkdtemp(prefix='bench_batch_feeds_')
+    try:
+        topic_model = TopicModeler()
+        topic_model.fit([])
+        store = ArticleFeatureStore(topic_model)
+        history = UserHistory(data_file=os.path.join(workdir, 'user_data.json'), feature_store=store)
+        articles = generate_articles(n_articles, seed=seed)
+        history.add_interactions(generate_histories(articles, n_users, n_users * events_per_user, seed=seed))
+        history.save_history()
+        recommender = Recommender(topic_model, CTRPredictor(), history, candidate_index=CandidateIndex(store))
+
+        print(f"{n_users} users, {n_articles} articles, {len(TOPIC_VOCAB)} topics")
+        print(f"{'workers':>8} {'users':>7} {'seconds':>8} {'users/s':>9}")
+        for n_workers in workers:
+            cache = FeedCache(os.path.join(workdir, f'feed_cache_{n_workers}.json'))
+            ranked, elapsed = batch_feeds.run(recommender, articles, cache, n_workers)
+            print(f"{n_workers:>8} {ranked:>7} {elapsed:>8.2f} {ranked / elapsed:>9.0f}")
+
+        # Incremental rerun: only users who clicked since the last batch are ranked again
+        touched = rng.choice(n_users, size=min(changed, n_users), replace=False)
+        history.add_interactions([(f"user_{u}", articles[0]['id'], True, articles[0], None) for u in touched])
+        ranked, elapsed = batch_feeds.run(recommender, articles, cache, workers[-1])
+        print(f"incremental: {ranked} changed users ranked in {elapsed:.2f}s")
+        history.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--events-per-user', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--changed', type=int, default=100, help="users who click before the incremental rerun")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.users, args.articles, args.events_per_user, args.workers, args.changed, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Two-stage retrieval (CandidateIndex + ranking) vs exhaustive ranking of the whole pool.
+
+Run with: python -m benchmarks.bench_candidates --pools 10000 100000 --users 10
+"""
+import argparse
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.generators import generate_articles, generate_histories
+from candidate_index import CandidateIndex
+from feature_store import ArticleFeatureStore
+from models import CTRPredictor, TopicModeler
+from recommender import Recommender
+from user_history import UserHistory
+
+
+def simulate(articles, n_users, impressions, seed):
+    """Generated impressions, with fresh stories clicked more often on top of the users' topic affinity"""
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    events = []
+    for user_id, key, clicked, article, timestamp in generate_histories(articles, n_users, impressions, seed=seed):
+        age = (now - datetime.fromisoformat(article['publishedAt'])).total_seconds() / 3600
+        clicked = clicked or bool(rng.random() < 0.4 * np.exp(-age / 24))
+        events.append((user_id, key, clicked, article, timestamp))
+    return events
+
+
+def run(pools, n_users, num_candidates, impressions, seed):
+    print(f"{'pool':>8} {'exhaustive ms':>14} {'two-stage ms':>13} {'recall@10':>10} {'candidate recall':>17}")
+    for pool_size in pools:
+        workdir = tempfile.mkdtemp(prefix='bench_candidates_')
+        topic_model = TopicModeler()
+        topic_model.fit([])
+        # Sized to hold the whole pool, as FEATURE_STORE_SIZE should be in the app
+        store = ArticleFeatureStore(topic_model, max_articles=2 * pool_size)
+        history = UserHistory(data_file=os.path.join(workdir, 'user_data.json'), feature_store=store)
+        articles = generate_articles(pool_size, seed=seed)
+        # The same interactions train the CTR model and make up the users' histories, as in the app
+        events = simulate(articles, n_users, impressions, seed)
+        sample = [e[3] for e in events]
+        ctr_predictor = CTRPredictor()
+        ctr_predictor.fit(sample, [int(e[2]) for e in events], user_ids=[e[0] for e in events],
+                          topics=store.topics(sample), epochs=2)
+        history.add_interactions(events)
+        # Synced after training, as the app re-scores the index with the serving model on every refresh
+        index = CandidateIndex(store, prior=ctr_predictor.article_prior)
+        index.sync(articles)
+        exhaustive = Recommender(topic_model, ctr_predictor, history)
+        two_stage = Recommender(topic_model, ctr_predictor, history, candidate_index=index,
+                                num_candidates=num_candidates)
+        exhaustive.recommend('user_0', articles)  # Warm the feature store and CTR feature cache
+
+        exhaustive_time = two_stage_time = 0.0
+        recall = candidate_recall = 0.0
+        for u in range(n_users):
+            user_id = f"user_{u}"
+            start = time.perf_counter()
+            expected = {a['url'] for a in exhaustive.recommend(user_id, articles)}
+            exhaustive_time += time.perf_counter() - start
+            start = time.perf_counter()
+            got = {a['url'] for a in two_stage.recommend(user_id, articles)}
+            two_stage_time += time.perf_counter() - start
+            candidates = {a['url'] for a in index.candidates(history.get_profile(user_id), num_candidates)}
+            recall += len(expected & got) / len(expected)
+            candidate_recall += len(expected & candidates) / len(expected)
+        print(f"{pool_size:>8} {exhaustive_time / n_users * 1000:>14.1f} {two_stage_time / n_users * 1000:>13.1f} "
+              f"{recall / n_users:>10.2f} {candidate_recall / n_users:>17.2f}")
+        history.close()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pools', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--num-candidates', type=int, default=2000)
+    parser.add_argument('--impressions', type=int, default=20000,
+                        help='simulated events the CTR model learns from and the histories hold')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    run(args.pools, args.users, args.num_candidates, args.impressions, args.seed)
@@ -0,0 +1,107 @@
+"""Memory held per interaction by UserHistory, columnar arrays vs the per-event dicts they replaced.
+
+Run with: python -m benchmarks.bench_history_memory --events 1000000 --users 10000
+Sizes are traced allocations for the interaction structures only; the article dicts themselves are
+shared by every representation and not counted, except in the original one that copied them per event.
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.generators import generate_articles, generate_histories
+from user_history import UserHistory
+
+
+def traced(build):
+    """Bytes still allocated by build() once it returns, and the object it built"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, result
+
+
+def article_copies(events):
+    # The original layout: every interaction carried its own parsed copy of the article
+    history = {}
+    for user_id, article_id, clicked, article, timestamp in events:
+        history.setdefault(user_id, []).append({'article_id': article_id, 'timestamp': timestamp,
+                                                'clicked': clicked, 'article_data': json.loads(json.dumps(article))})
+    return history
+
+
+def dicts(events):
+    history = {}
+    for user_id, article_id, clicked, article, timestamp in events:
+        history.setdefault(user_id, []).append({'article_id': article_id, 'timestamp': timestamp, 'clicked': clicked})
+    return json.loads(json.dumps(history))  # As loaded from a snapshot: strings are no longer shared
+
+
+def columnar(events, workdir):
+    history = UserHistory(os.path.join(workdir, 'user_data.json'), compact_every=10 ** 9, compact_interval=10 ** 6)
+    for start in range(0, len(events), 10000):
+        history.add_interactions(events[start:start + 10000])
+    history.close()
+    return history
+
+
+def legacy_stats(interactions):
+    clicks = sum(1 for h in interactions if h['clicked'])
+    return len(interactions) - clicks, clicks, len(set(h['article_id'] for h in interactions))
+
+
+def per_call_us(fn, repeat=100):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(n_events, n_users, n_articles, copies, seed):
+    articles = generate_articles(n_articles, seed=seed)
+    events = generate_histories(articles, n_users, n_events, seed=seed)
+    workdir = tempfile.mkdtemp(prefix='bench_history_memory_')
+    try:
+        results = []
+        if copies:
+            results.append(('dicts + article copies', traced(lambda: article_copies(events))[0]))
+        size, legacy = traced(lambda: dicts(events))
+        results.append(('dicts, interned articles', size))
+        size, history = traced(lambda: columnar(events, workdir))
+        results.append(('columnar arrays', size))
+
+        print(f"{len(events)} events, {len(history.history)} users, {len(history.article_table)} articles")
+        print(f"{'representation':<26} {'MB':>9} {'MB per 1M events':>17} {'bytes/event':>12}")
+        for name, size in results:
+            print(f"{name:<26} {size / 2 ** 20:>9.1f} {size / 2 ** 20 * 1e6 / len(events):>17.1f} "
+                  f"{size / len(events):>12.1f}")
+
+        # The heaviest user's /profile numbers: a scan of the list before, counters now
+        user_id = max(legacy, key=lambda user: len(legacy[user]))
+        assert legacy_stats(legacy[user_id]) == tuple(history.stats(user_id).values())
+        print(f"stats() for {user_id} ({len(legacy[user_id])} events): "
+              f"scan {per_call_us(lambda: legacy_stats(legacy[user_id])):.1f} us, "
+              f"counters {per_call_us(lambda: history.stats(user_id)):.2f} us")
+        length = history.history_length(user_id)
+        print(f"last page of 10: {per_call_us(lambda: history.get_history(user_id, 10, length - 10)):.1f} us")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--articles', type=int, default=5000)
+    parser.add_argument('--copies', action='store_true', help="also build the original per-event article copies")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.events, args.users, args.articles, args.copies, args.seed)
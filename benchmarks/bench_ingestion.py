@@ -0,0 +1,66 @@
+"""Cold-start ingestion: one request per page in sequence vs NewsFetcher.iter_articles.
+
+Run with: python -m benchmarks.bench_ingestion --queries 10 --pages 10 --latency 0.1
+"""
+import argparse
+import time
+
+import requests
+
+from benchmarks.mock_newsapi import MockNewsAPI
+from data_fetcher import NewsFetcher
+
+TOPICS = ("technology climate finance space education health science politics sports business "
+          "energy travel culture security markets").split()
+
+
+def sequential_ingest(api, queries, pages, page_size):
+    # The pre-pipeline approach: an un-pooled requests.get per query and page
+    articles = []
+    for query in queries:
+        for page in range(1, pages + 1):
+            response = requests.get(api.url + "everything",
+                                    params={'q': query, 'apiKey': 'test', 'pageSize': page_size, 'page': page})
+            articles.extend(response.json().get('articles', []))
+    return articles
+
+
+def run(n_queries, pages, page_size, latency, workers, duplicate_every, rate_limit):
+    queries = [TOPICS[i % len(TOPICS)] + (str(i // len(TOPICS)) if i >= len(TOPICS) else '')
+               for i in range(n_queries)]
+    with MockNewsAPI(latency=latency, total_results=pages * page_size,
+                     duplicate_every=duplicate_every, rate_limit=rate_limit) as api:
+        start = time.perf_counter()
+        articles = sequential_ingest(api, queries, pages, page_size) if not rate_limit else []
+        sequential_time = time.perf_counter() - start
+        if not rate_limit:
+            print(f"sequential:  {len(articles)} articles in {sequential_time:.2f}s")
+
+        fetcher = NewsFetcher(api_key='test', base_url=api.url, max_workers=workers, backoff=0.1)
+        api.requests = 0
+        start = time.perf_counter()
+        first = None
+        count = 0
+        for _ in fetcher.iter_articles(queries, pages=pages, page_size=page_size):
+            if first is None:
+                first = time.perf_counter() - start
+            count += 1
+        elapsed = time.perf_counter() - start
+        print(f"concurrent:  {count} unique articles in {elapsed:.2f}s "
+              f"(first after {first:.3f}s, {count / elapsed:.0f} articles/s, "
+              f"{api.requests} requests, {api.rate_limited} rate limited)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--duplicate-every', type=int, default=5)
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help='have the mock answer 429 above this many requests per second')
+    args = parser.parse_args()
+    run(args.queries, args.pages, args.page_size, args.latency, args.workers, args.duplicate_every,
+        args.rate_limit)
@@ -0,0 +1,79 @@
+"""MMR selection: vectorized engine vs the original per-pair cosine_similarity loop.
+
+Run with: python -m benchmarks.bench_mmr --sizes 100 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from benchmarks.generators import generate_articles
+from feature_store import article_text
+from recommender import mmr_select
+
+
+def legacy_mmr(texts, scores, lambda_param, num):
+    tfidf_matrix = TfidfVectorizer(max_features=1000).fit(texts).transform(texts)
+    selected = []
+    remaining = list(range(len(texts)))
+    while len(selected) < num and remaining:
+        best_score = -np.inf
+        best_idx = None
+        for idx in remaining:
+            relevance = scores[idx]
+            diversity = 0
+            if selected:
+                similarities = [cosine_similarity(tfidf_matrix[idx:idx+1], tfidf_matrix[s:s+1])[0][0] for s in selected]
+                diversity = 1 - max(similarities)
+            mmr_score = lambda_param * relevance - (1 - lambda_param) * diversity
+            if mmr_score > best_score:
+                best_score = mmr_score
+                best_idx = idx
+        if best_idx is not None:
+            selected.append(best_idx)
+            remaining.remove(best_idx)
+    return selected
+
+
+def vectorized_mmr(texts, scores, lambda_param, num, candidate_pool=None):
+    tfidf_matrix = TfidfVectorizer(max_features=1000).fit_transform(texts)
+    return mmr_select(tfidf_matrix, scores, lambda_param, num, candidate_pool)
+
+
+def make_corpus(n, seed):
+    texts = [article_text(a) for a in generate_articles(n, seed=seed)]
+    return texts, np.random.default_rng(seed).random(n)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run(sizes, num, lambda_param, legacy_limit, seed):
+    print(f"{'n':>8} {'legacy s':>10} {'vector s':>10} {'top-100 s':>10} {'speedup':>8} {'same':>5}")
+    for n in sizes:
+        texts, scores = make_corpus(n, seed)
+        picks, vector_time = timed(vectorized_mmr, texts, scores, lambda_param, num)
+        _, pool_time = timed(vectorized_mmr, texts, scores, lambda_param, num, 100)
+        if n <= legacy_limit:
+            legacy_picks, legacy_time = timed(legacy_mmr, texts, scores, lambda_param, num)
+            print(f"{n:>8} {legacy_time:>10.3f} {vector_time:>10.3f} {pool_time:>10.3f} "
+                  f"{legacy_time / vector_time:>7.1f}x {str(picks == legacy_picks):>5}")
+        else:
+            print(f"{n:>8} {'-':>10} {vector_time:>10.3f} {pool_time:>10.3f} {'-':>8} {'-':>5}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--num', type=int, default=10)
+    parser.add_argument('--lambda-param', type=float, default=0.5)
+    parser.add_argument('--legacy-limit', type=int, default=10000,
+                        help='skip the original implementation above this many candidates')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.num, args.lambda_param, args.legacy_limit, args.seed)
@@ -0,0 +1,107 @@
+"""Near-duplicate clustering (MinHash/LSH) on a synthetic corpus of syndicated copies: speed, precision, recall.
+
+Run with: python -m benchmarks.bench_near_duplicates --articles 100000 --batches 10
+"""
+import argparse
+from collections import Counter
+import time
+
+import numpy as np
+
+from benchmarks.generators import SOURCES, generate_articles
+from data_fetcher import article_id, title_hash
+from near_duplicates import NearDuplicateIndex
+
+PREFIXES = ["", "", "UPDATE: ", "(Reuters) - ", "Breaking: "]
+
+
+def syndicate(original, copy, rng, edit_rate):
+    """A copy as another outlet would run it: new URL and source, tagged title, lightly edited text"""
+    source = SOURCES[int(rng.integers(len(SOURCES)))]
+    words = original['description'].split()
+    for _ in range(int(len(words) * edit_rate)):
+        i = int(rng.integers(len(words)))
+        if rng.random() < 0.5 and len(words) > 5:
+            del words[i]
+        else:
+            words[i] = words[int(rng.integers(len(words)))]
+    title = PREFIXES[int(rng.integers(len(PREFIXES)))] + original['title']
+    if rng.random() < 0.5:
+        title += f" - {source}"
+    article = dict(original, title=title, description=' '.join(words), source={"id": None, "name": source},
+                   url=original['url'].replace('news.example.com', f"copy{copy}.example.org"))
+    article['id'] = article_id(article)
+    return article
+
+
+def make_corpus(n, dup_share, max_copies, edit_rate, seed):
+    """About n articles where dup_share of the stories also appear as 1..max_copies syndicated copies"""
+    rng = np.random.default_rng(seed)
+    originals = generate_articles(n, seed=seed)
+    corpus, truth = [], []
+    for story, original in enumerate(originals):
+        corpus.append(original)
+        truth.append(story)
+        if rng.random() < dup_share:
+            for copy in range(min(int(rng.zipf(2.0)), max_copies)):
+                corpus.append(syndicate(original, copy, rng, edit_rate))
+                truth.append(story)
+        if len(corpus) >= n:
+            break
+    order = rng.permutation(len(corpus))
+    return [corpus[i] for i in order], [truth[i] for i in order]
+
+
+def pair_counts(labels):
+    return sum(c * (c - 1) // 2 for c in Counter(labels).values())
+
+
+def precision_recall(predicted, truth):
+    """Pairwise: of the article pairs put in one cluster, how many are true copies, and vice versa"""
+    together = pair_counts(list(zip(predicted, truth)))
+    predicted_pairs = pair_counts(predicted)
+    true_pairs = pair_counts(truth)
+    return (together / predicted_pairs if predicted_pairs else 1.0,
+            together / true_pairs if true_pairs else 1.0)
+
+
+def run(n, batches, dup_share, max_copies, edit_rate, threshold, seed):
+    corpus, truth = make_corpus(n, dup_share, max_copies, edit_rate, seed)
+    print(f"{len(corpus)} articles, {len(set(truth))} stories, {pair_counts(truth)} duplicate pairs")
+
+    # Exact keys, as NewsFetcher dedupes today
+    exact = [title_hash(a['title']) for a in corpus]
+    precision, recall = precision_recall(exact, truth)
+    print(f"exact title hash: {len(set(exact))} kept, precision {precision:.3f}, recall {recall:.3f}")
+
+    index = NearDuplicateIndex(threshold=threshold)
+    print(f"{'pool':>8} {'batch ms':>9} {'us/article':>11}")
+    clusters = []
+    step = -(-len(corpus) // batches)
+    for start in range(0, len(corpus), step):
+        batch = corpus[start:start + step]
+        began = time.perf_counter()
+        clusters.extend(index.clusters(batch))
+        elapsed = time.perf_counter() - began
+        print(f"{start + len(batch):>8} {elapsed * 1000:>9.1f} {elapsed / len(batch) * 1e6:>11.1f}")
+    precision, recall = precision_recall(clusters, truth)
+    print(f"MinHash/LSH: {len(set(clusters))} kept, precision {precision:.3f}, recall {recall:.3f}")
+
+    began = time.perf_counter()
+    kept = index.dedupe(corpus)
+    elapsed = time.perf_counter() - began
+    sizes = Counter(a['cluster_size'] for a in kept)
+    print(f"refresh of the full pool (all seen): {elapsed * 1000:.0f} ms; cluster sizes {sorted(sizes.items())[:6]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--articles', type=int, default=100000)
+    parser.add_argument('--batches', type=int, default=10)
+    parser.add_argument('--dup-share', type=float, default=0.3, help="share of stories that get copies")
+    parser.add_argument('--max-copies', type=int, default=20)
+    parser.add_argument('--edit-rate', type=float, default=0.1, help="share of description words edited per copy")
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.articles, args.batches, args.dup_share, args.max_copies, args.edit_rate, args.threshold, args.seed)
@@ -0,0 +1,82 @@
+"""Batched ranking throughput: Recommender.recommend_many vs one recommend() call per user.
+
+Run with: python -m benchmarks.bench_recommend_many --users 10000 --articles 1000
+Per-user ranking runs as the app does (candidate index above 2000 articles, the NUM_CANDIDATES default)
+on a sample of the users; overlap is the mean share of each sampled user's top 10 that both paths agree
+on. The first candidate pool is recommend_many's default, which batch_feeds.py uses: it matches
+recommend() up to 2000 articles. The throughput gap is that recommend() computes the article CTR
+logits and TF-IDF similarities per request, where recommend_many computes them once for the pool.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.generators import generate_articles, generate_histories
+from candidate_index import CandidateIndex
+from feature_store import ArticleFeatureStore
+from models import CTRPredictor, TopicModeler
+from recommender import Recommender
+from user_history import UserHistory
+
+
+def run(n_users, n_articles, events_per_user, sample, candidate_pools, chunk_size, seed):
+    workdir = tempfile.mkdtemp(prefix='bench_recommend_many_')
+    try:
+        articles = generate_articles(n_articles, seed=seed)
+        events = generate_histories(articles, n_users, n_users * events_per_user, seed=seed)
+        topic_model = TopicModeler()
+        topic_model.fit([])
+        store = ArticleFeatureStore(topic_model)
+        history = UserHistory(os.path.join(workdir, 'user_data.json'), feature_store=store,
+                              compact_every=10 ** 9, compact_interval=10 ** 6)
+        history.add_interactions(events)
+        ctr_predictor = CTRPredictor()
+        topics = store.topics([e[3] for e in events])
+        ctr_predictor.fit([e[3] for e in events], [int(e[2]) for e in events],
+                          user_ids=[e[0] for e in events], topics=topics, epochs=1)
+        index = CandidateIndex(store)
+        index.sync(articles)
+        recommender = Recommender(topic_model, ctr_predictor, history, candidate_index=index)
+        users = [f"user_{u}" for u in range(n_users)]
+        sampled = [users[i] for i in np.random.default_rng(seed).choice(n_users, size=min(sample, n_users),
+                                                                        replace=False)]
+        recommender.recommend(sampled[0], articles)  # Warm the feature store and CTR feature cache
+
+        print(f"{n_users} users, {n_articles} articles, {len(events)} events")
+        print(f"{'method':<32} {'seconds':>8} {'users/s':>9} {'overlap':>8}")
+        start = time.perf_counter()
+        single = {user_id: recommender.recommend(user_id, articles) for user_id in sampled}
+        elapsed = time.perf_counter() - start
+        print(f"{'recommend() per user':<32} {elapsed / len(sampled) * n_users:>8.2f} "
+              f"{len(sampled) / elapsed:>9.0f} {'':>8}")
+        for candidate_pool in candidate_pools:
+            start = time.perf_counter()
+            batch = recommender.recommend_many(users, articles, candidate_pool=candidate_pool,
+                                               chunk_size=chunk_size)
+            elapsed = time.perf_counter() - start
+            overlap = np.mean([len({a['id'] for a in single[u]} & {a['id'] for a in batch[u]}) / len(single[u])
+                               for u in sampled])
+            name = f"recommend_many(candidate_pool={candidate_pool or 'default'})"
+            print(f"{name:<32} {elapsed:>8.2f} {n_users / elapsed:>9.0f} {overlap:>8.2f}")
+        history.close()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--events-per-user', type=int, default=20)
+    parser.add_argument('--sample', type=int, default=500, help="users ranked one at a time for comparison")
+    parser.add_argument('--candidate-pools', type=int, nargs='+', default=[None, 500, 100],
+                        help="articles MMR re-ranks per user (default: num_candidates, as batch_feeds.py does)")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.users, args.articles, args.events_per_user, args.sample, args.candidate_pools, args.chunk_size,
+        args.seed)
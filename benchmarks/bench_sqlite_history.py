@@ -0,0 +1,91 @@
+"""Multi-process load test of SQLiteUserHistory: concurrent writers, lost events, and reader memory.
+
+Run with: python -m benchmarks.bench_sqlite_history --processes 8 --events 20000
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from feature_store import ArticleFeatureStore
+from models import TopicModeler
+from sqlite_history import SQLiteUserHistory
+
+ARTICLE = {
+    "title": "AI Advances in Healthcare",
+    "description": "New AI models are revolutionizing medical diagnostics.",
+    "url": "https://example.com/ai-healthcare",
+    "source": {"name": "Tech News"}
+}
+
+
+def open_history(db_file):
+    # With a feature store, as the app opens it
+    topic_model = TopicModeler()
+    topic_model.fit([])
+    return SQLiteUserHistory(db_file, feature_store=ArticleFeatureStore(topic_model))
+
+
+def write(db_file, worker, events, batch_size, users):
+    # Each process opens its own connection, like one gunicorn worker
+    history = open_history(db_file)
+    for start in range(0, events, batch_size):
+        history.add_interactions([(f"user_{(worker * events + i) % users}", f"w{worker}-{i}", i % 3 == 0,
+                                   dict(ARTICLE, url=f"{ARTICLE['url']}/{worker}-{i}"), None)
+                                  for i in range(start, min(start + batch_size, events))])
+    history.close()
+
+
+def read(db_file, queue):
+    # Page through one user's history and stream all training data, then report peak RSS
+    history = open_history(db_file)
+    rows = sum(len(y) for _, y in history.iter_training_data())
+    page = history.get_history('user_0', limit=10, offset=history.history_length('user_0') - 10)
+    history.close()
+    queue.put((rows, len(page), len(history.feature_store), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run(processes, events, batch_size, users):
+    workdir = tempfile.mkdtemp(prefix='bench_sqlite_history_')
+    db_file = os.path.join(workdir, 'user_data.db')
+    SQLiteUserHistory(db_file).close()
+    ctx = multiprocessing.get_context('spawn')
+    try:
+        print(f"{'round':>6} {'total events':>13} {'write s':>8} {'events/s':>10} {'lost':>5} "
+              f"{'read rows':>10} {'store size':>11} {'reader RSS MB':>14}")
+        for round_ in range(1, 4):
+            writers = [ctx.Process(target=write, args=(db_file, round_ * processes + w, events, batch_size, users))
+                       for w in range(processes)]
+            start = time.perf_counter()
+            for p in writers:
+                p.start()
+            for p in writers:
+                p.join()
+            elapsed = time.perf_counter() - start
+
+            history = SQLiteUserHistory(db_file)
+            total = sum(history.history_lengths().values())
+            history.close()
+            expected = round_ * processes * events
+            queue = ctx.Queue()
+            reader = ctx.Process(target=read, args=(db_file, queue))
+            reader.start()
+            rows, _, stored, rss = queue.get()
+            reader.join()
+            print(f"{round_:>6} {total:>13} {elapsed:>8.2f} {processes * events / elapsed:>10.0f} "
+                  f"{expected - total:>5} {rows:>10} {stored:>11} {rss:>14.1f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--events', type=int, default=20000, help="events per process per round")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+    run(args.processes, args.events, args.batch_size, args.users)
@@ -0,0 +1,115 @@
+"""Cold start and per-worker memory of the app with ML enabled, across several worker processes.
+
+Run with: python -m benchmarks.bench_startup --workers 4 --features 4194304
+Each worker is a fresh interpreter that imports app, warms up and serves one request; RSS and PSS
+(RSS with shared pages divided among the processes sharing them) are read while all are alive.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.generators import generate_articles, generate_histories
+from benchmarks.mock_newsapi import MockNewsAPI
+from feature_store import ArticleFeatureStore
+from models import CTRPredictor, TopicModeler
+from user_history import UserHistory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+if hasattr(app, 'warm_up'):
+    app.warm_up()
+warmed = time.perf_counter()
+status = app.app.test_client().get('/').status_code
+served = time.perf_counter()
+print("RESULT " + json.dumps({
+    'import_s': imported - start, 'warm_up_s': warmed - imported, 'first_request_s': served - warmed,
+    'status': status, 'sklearn_loaded': 'sklearn' in sys.modules}), flush=True)
+sys.stdin.read()  # Stay alive until the parent has measured every worker
+'''
+
+
+def memory(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Dirty:', 'Shared_Clean:'):
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return values
+
+
+def prepare(workdir, n_features, n_articles, events, seed):
+    os.makedirs(os.path.join(workdir, 'models'), exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        topic_model = TopicModeler()
+        topic_model.fit([])
+        topic_model.save_model()
+        articles = generate_articles(n_articles, seed=seed)
+        history = generate_histories(articles, 1000, events, seed=seed)
+        ctr_predictor = CTRPredictor(n_features=n_features)
+        ctr_predictor.fit([e[3] for e in history], [int(e[2]) for e in history],
+                          user_ids=[e[0] for e in history], epochs=1)
+        ctr_predictor.save_model()
+        # Absolute path: background compaction may run after the working directory is restored
+        user_history = UserHistory(os.path.join(workdir, 'user_data.json'),
+                                   feature_store=ArticleFeatureStore(topic_model))
+        user_history.add_interactions(history)
+        user_history.save_history()
+        user_history.close()
+    finally:
+        os.chdir(cwd)
+    return articles
+
+
+def run(workers, n_features, n_articles, events, seed):
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        articles = prepare(workdir, n_features, n_articles, events, seed)
+        with MockNewsAPI(corpus=articles) as api:
+            env = dict(os.environ, ML_ENABLED='1', NEWS_API_URL=api.url, NEWS_API_KEY='bench',
+                       NEWS_PAGES=str(-(-n_articles // 100)), PYTHONPATH=ROOT)
+            procs = [subprocess.Popen([sys.executable, '-c', WORKER], cwd=workdir, env=env, text=True,
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                     for _ in range(workers)]
+            results = []
+            for proc in procs:
+                for line in proc.stdout:
+                    if line.startswith('RESULT '):
+                        results.append(json.loads(line[len('RESULT '):]))
+                        break
+            for proc, result in zip(procs, results):
+                result.update(memory(proc.pid))
+            for proc in procs:
+                proc.stdin.close()
+                proc.wait()
+
+        print(f"{'worker':>6} {'import s':>9} {'warm-up s':>10} {'1st req s':>10} {'RSS MB':>8} {'PSS MB':>8} "
+              f"{'private MB':>11} {'sklearn':>8}")
+        for i, r in enumerate(results):
+            print(f"{i:>6} {r['import_s']:>9.2f} {r['warm_up_s']:>10.2f} {r['first_request_s']:>10.2f} "
+                  f"{r['Rss']:>8.1f} {r['Pss']:>8.1f} {r['Private_Dirty']:>11.1f} {str(r['sklearn_loaded']):>8}")
+        print(f"total PSS across {workers} workers: {sum(r['Pss'] for r in results):.1f} MB")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--features', type=int, default=2 ** 22, help="CTR model hash space")
+    parser.add_argument('--articles', type=int, default=500)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.workers, args.features, args.articles, args.events, args.seed)
@@ -0,0 +1,49 @@
+"""TopicModeler.transform: batch keyword scan vs the original per-document loop.
+
+Run with: python -m benchmarks.bench_topic_model --sizes 1000 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.generators import generate_articles
+from feature_store import article_text
+from models import TopicModeler
+
+
+def legacy_transform(keywords, documents):
+    topics = []
+    for doc in documents:
+        doc_lower = doc.lower()
+        scores = []
+        for topic_id, kws in keywords.items():
+            score = sum(1 for kw in kws if kw in doc_lower)
+            scores.append(score)
+        topic = np.argmax(scores) if max(scores) > 0 else 0
+        topics.append(topic)
+    return topics
+
+
+def run(sizes, seed):
+    model = TopicModeler()
+    model.fit([])
+    print(f"{'docs':>8} {'legacy s':>10} {'batch s':>10} {'speedup':>8} {'same':>5}")
+    for n in sizes:
+        documents = [article_text(a) for a in generate_articles(n, seed=seed)]
+        start = time.perf_counter()
+        expected = legacy_transform(model.keywords, documents)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        topics, scores = model.transform(documents)
+        batch_time = time.perf_counter() - start
+        same = [int(t) for t in expected] == topics
+        print(f"{n:>8} {legacy_time:>10.3f} {batch_time:>10.3f} {legacy_time / batch_time:>7.1f}x {str(same):>5}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.seed)
@@ -0,0 +1,56 @@
+"""Per-event write cost of UserHistory.add_interaction as the history grows.
+
+Run with: python -m benchmarks.bench_user_history --events 10000000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from user_history import UserHistory
+
+ARTICLE = {
+    "title": "AI Advances in Healthcare",
+    "description": "New AI models are revolutionizing medical diagnostics.",
+    "url": "https://example.com/ai-healthcare",
+    "source": {"name": "Tech News"}
+}
+
+
+def checkpoints(limit):
+    point = 1000
+    while point <= limit:
+        yield point
+        point *= 10
+
+
+def run(max_events, window, users):
+    workdir = tempfile.mkdtemp(prefix='bench_history_')
+    history = UserHistory(data_file=os.path.join(workdir, 'user_data.json'))
+    print(f"{'events':>12} {'us/event':>10}")
+    try:
+        written = 0
+        for point in checkpoints(max_events):
+            # Grow the history untimed, then time a window of writes ending at the checkpoint
+            while written < point - window:
+                history.add_interaction(f"user_{written % users}", written, written % 3 == 0, ARTICLE)
+                written += 1
+            start = time.perf_counter()
+            while written < point:
+                history.add_interaction(f"user_{written % users}", written, written % 3 == 0, ARTICLE)
+                written += 1
+            elapsed = time.perf_counter() - start
+            print(f"{point:>12} {elapsed / window * 1e6:>10.2f}")
+    finally:
+        history.close()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--window', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+    run(args.events, args.window, args.users)
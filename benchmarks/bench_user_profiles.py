@@ -0,0 +1,67 @@
+"""Feed latency for light vs heavy users: incremental profiles vs walking the whole history.
+
+Run with: python -m benchmarks.bench_user_profiles --interactions 10 100000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.generators import generate_articles, generate_histories
+from feature_store import ArticleFeatureStore
+from models import CTRPredictor, TopicModeler
+from recommender import Recommender
+from user_history import UserHistory
+
+
+def legacy_user_topics(history, user_id, topic_model):
+    # What every feed request used to do: walk the user's history, one transform per click
+    topics = []
+    for h in history.get_history(user_id):
+        article = history.get_article(h['article_id'])
+        if h['clicked'] and article:
+            topic, _ = topic_model.transform([article['title'] + ' ' + article['description']])
+            topics.extend(topic)
+    return list(set(topics))
+
+
+def time_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(sizes, pool_size, repeat, seed):
+    workdir = tempfile.mkdtemp(prefix='bench_profiles_')
+    topic_model = TopicModeler()
+    topic_model.fit([])
+    store = ArticleFeatureStore(topic_model)
+    history = UserHistory(data_file=os.path.join(workdir, 'user_data.json'), feature_store=store)
+    recommender = Recommender(topic_model, CTRPredictor(), history)
+    articles = generate_articles(pool_size, seed=seed)
+    try:
+        print(f"{'interactions':>12} {'feed ms':>10} {'legacy topics ms':>17}")
+        for size in sizes:
+            user_id = f"user_{size}"
+            # One user, every event a click (ctr=1), so the legacy walk transforms each of them
+            events = generate_histories(articles, 1, size, seed=seed + size, ctr=1.0)
+            history.add_interactions([(user_id, *event[1:]) for event in events])
+            history.save_history()  # Keep background compaction out of the timings
+            feed_ms = time_call(lambda: recommender.recommend(user_id, articles), repeat)
+            legacy_ms = time_call(lambda: legacy_user_topics(history, user_id, topic_model), max(1, repeat // 10))
+            print(f"{size:>12} {feed_ms:>10.2f} {legacy_ms:>17.2f}")
+    finally:
+        history.close()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--interactions', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--pool-size', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    run(args.interactions, args.pool_size, args.repeat, args.seed)
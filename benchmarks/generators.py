@@ -0,0 +1,91 @@
+"""Seeded synthetic data: NewsAPI-shaped article corpora and Zipf-distributed click histories."""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from data_fetcher import article_id
+
+# Vocabulary per topic, aligned with TopicModeler's default keywords so topics are recoverable
+TOPIC_VOCAB = [
+    ['ai', 'machine', 'learning', 'technology', 'neural', 'robot', 'algorithm', 'software'],
+    ['climate', 'environment', 'change', 'global', 'carbon', 'emissions', 'renewable', 'warming'],
+    ['stock', 'market', 'finance', 'economy', 'investment', 'trading', 'inflation', 'bank'],
+    ['space', 'nasa', 'exploration', 'mars', 'rocket', 'orbit', 'astronaut', 'satellite'],
+    ['education', 'school', 'students', 'teachers', 'university', 'curriculum', 'exam', 'tech'],
+]
+FILLER = ("the a new report says after week officials plan study people city data first year could "
+          "more over amid latest update analysis experts warn record").split()
+SOURCES = ["Tech News", "Environment Daily", "Finance Today", "Science Weekly", "Campus Report",
+           "World Wire", "Daily Ledger", "Metro Times"]
+
+
+def _sentence(rng, topic, length, topical=0.4):
+    vocab = TOPIC_VOCAB[topic]
+    words = [vocab[rng.integers(len(vocab))] if rng.random() < topical else FILLER[rng.integers(len(FILLER))]
+             for _ in range(length)]
+    return ' '.join(words)
+
+
+def generate_articles(n, seed=0, days=7, now=None):
+    """n articles shaped like NewsAPI results, each drawn mostly from one topic's vocabulary"""
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now()
+    articles = []
+    for i in range(n):
+        topic = int(rng.integers(len(TOPIC_VOCAB)))
+        title = _sentence(rng, topic, int(rng.integers(6, 12))).capitalize()
+        source = SOURCES[int(rng.integers(len(SOURCES)))]
+        article = {
+            "source": {"id": None, "name": source},
+            "author": f"Reporter {int(rng.integers(500))}",
+            "title": f"{title} ({i})",
+            "description": _sentence(rng, topic, int(rng.integers(15, 30))).capitalize() + '.',
+            "url": f"https://news.example.com/{source.lower().replace(' ', '-')}/{seed}/{i}",
+            "urlToImage": f"https://news.example.com/img/{seed}/{i}.jpg",
+            "publishedAt": (now - timedelta(seconds=int(rng.integers(days * 24 * 3600)))).isoformat(),
+            "content": _sentence(rng, topic, 60) + '...',
+        }
+        article['id'] = article_id(article)
+        articles.append(article)
+    return articles
+
+
+def article_topic(article):
+    """Topic the generator drew the article from (most frequent topic word)"""
+    words = (article['title'] + ' ' + article['description']).lower().split()
+    counts = [sum(word in vocab for word in words) for vocab in TOPIC_VOCAB]
+    return int(np.argmax(counts))
+
+
+def generate_histories(articles, n_users, events, seed=0, zipf_a=1.3, ctr=0.1, affinity=0.7, now=None):
+    """events (user_id, article_id, clicked, article, timestamp) with Zipf user activity and article popularity
+
+    Each user favours one topic: that share (affinity) of their picks comes from it, and clicks on it are
+    three times likelier than elsewhere. Events are returned in timestamp order.
+    """
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now()
+    topics = np.array([article_topic(a) for a in articles])
+    by_topic = [np.flatnonzero(topics == t) for t in range(len(TOPIC_VOCAB))]
+    # Popularity rank is a random permutation, so popular articles are spread across topics
+    rank = rng.permutation(len(articles))
+
+    users = (rng.zipf(zipf_a, size=events) - 1) % n_users
+    favourite = rng.integers(len(TOPIC_VOCAB), size=n_users)
+    picks = (rng.zipf(zipf_a, size=events) - 1) % len(articles)
+    on_topic = rng.random(events) < affinity
+    offsets = np.sort(rng.integers(30 * 24 * 3600, size=events))[::-1]
+
+    generated = []
+    for user, pick, topical, offset in zip(users.tolist(), picks.tolist(), on_topic.tolist(), offsets.tolist()):
+        candidates = by_topic[favourite[user]]
+        if topical and len(candidates):
+            index = int(candidates[pick % len(candidates)])
+        else:
+            index = int(rank[pick])
+        article = articles[index]
+        p_click = min(ctr * (3 if topics[index] == favourite[user] else 1), 1.0)
+        clicked = bool(rng.random() < p_click)
+        timestamp = (now - timedelta(seconds=offset)).isoformat()
+        generated.append((f"user_{user}", article['id'], clicked, article, timestamp))
+    return generated
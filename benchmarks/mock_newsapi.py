@@ -0,0 +1,136 @@
+"""Local stand-in for the NewsAPI /v2/everything endpoint, for benchmarks and manual testing.
+
+Run standalone with: python -m benchmarks.mock_newsapi --port 8099 --latency 0.2
+then point the app at it with NEWS_API_URL=http://127.0.0.1:8099/v2/ NEWS_API_KEY=test.
+"""
+import argparse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+class MockNewsAPI:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, total_results=100, duplicate_every=0,
+                 rate_limit=0, corpus=None):
+        self.latency = latency  # Seconds to sleep before every response
+        self.total_results = total_results  # Articles available per query
+        self.duplicate_every = duplicate_every  # Every Nth article is a story shared by all queries
+        self.rate_limit = rate_limit  # Requests per second before answering 429
+        self.corpus = corpus  # Fixed article list served to every query instead of generated stories
+        self.requests = 0
+        self.rate_limited = 0
+        self._window = (0, 0)  # (second, requests seen in it)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v2/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def articles(self, query, page, page_size):
+        start = (page - 1) * page_size
+        if self.corpus is not None:
+            return self.corpus[start:start + page_size]
+        now = datetime.now()
+        articles = []
+        for i in range(start, min(start + page_size, self.total_results)):
+            if self.duplicate_every and i % self.duplicate_every == 0:
+                # Syndicated copy: same story under a tracking-tagged URL in every query
+                url = f"https://www.example.com/shared/{i}/?utm_source={query}"
+                title = f"Shared story {i}"
+            else:
+                url = f"https://example.com/{query}/{i}"
+                title = f"{query.title()} story {i}"
+            articles.append({
+                "title": title,
+                "description": f"Coverage of {query} developments, part {i}.",
+                "content": f"Full text of {query} story {i}...",
+                "url": url,
+                "publishedAt": (now - timedelta(minutes=i)).isoformat(),
+                "source": {"name": f"Source {i % 7}"}
+            })
+        return articles
+
+    def _over_rate_limit(self):
+        if not self.rate_limit:
+            return False
+        second = int(time.time())
+        with self._lock:
+            window_second, count = self._window
+            count = count + 1 if window_second == second else 1
+            self._window = (second, count)
+        return count > self.rate_limit
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                api.requests += 1
+                if api._over_rate_limit():
+                    api.rate_limited += 1
+                    return self._send(429, {"status": "error", "code": "rateLimited"}, retry_after=1)
+                if api.latency:
+                    time.sleep(api.latency)
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if not url.path.endswith('/everything') or 'apiKey' not in params:
+                    return self._send(404 if 'apiKey' in params else 401, {"status": "error"})
+                query = params.get('q', 'news')
+                page = int(params.get('page', 1))
+                page_size = int(params.get('pageSize', 20))
+                self._send(200, {
+                    "status": "ok",
+                    "totalResults": len(api.corpus) if api.corpus is not None else api.total_results,
+                    "articles": api.articles(query, page, page_size),
+                })
+
+            def _send(self, status, body, retry_after=None):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header('Retry-After', str(retry_after))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--total-results', type=int, default=100)
+    parser.add_argument('--duplicate-every', type=int, default=0)
+    parser.add_argument('--rate-limit', type=int, default=0)
+    args = parser.parse_args()
+    server = MockNewsAPI(port=args.port, latency=args.latency, total_results=args.total_results,
+                         duplicate_every=args.duplicate_every, rate_limit=args.rate_limit)
+    print(f"Mock NewsAPI listening on {server.url}")
+    server._server.serve_forever()
@@ -0,0 +1,245 @@
+"""Benchmark suite: per-component micro-benchmarks at several scales and an end-to-end HTTP load run.
+
+Run with: python -m benchmarks.suite --scales 100 1000 10000 --output results.json
+and later: python -m benchmarks.suite --baseline results.json
+Results are JSON; with --baseline, any benchmark slower than the baseline by more than --tolerance
+is reported and the exit status is 1, so the suite can gate a deploy.
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.generators import generate_articles, generate_histories
+from benchmarks.mock_newsapi import MockNewsAPI
+from candidate_index import CandidateIndex
+from feature_store import ArticleFeatureStore
+from models import CTRPredictor, TopicModeler
+from recommender import Recommender, mmr_select
+from sqlite_history import SQLiteUserHistory
+from user_history import UserHistory
+
+
+def measure(fn, repeat, setup=None, items=None):
+    """Median and best wall time of fn over repeat runs; setup() runs untimed before each and feeds fn"""
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state) if setup else fn()
+        times.append(time.perf_counter() - start)
+    result = {'median_s': statistics.median(times), 'min_s': min(times), 'repeat': repeat}
+    if items:
+        result['items'] = items
+        result['per_item_us'] = result['median_s'] / items * 1e6
+    return result
+
+
+def micro(n, n_users, repeat, seed, workdir):
+    """Each component on an n-article corpus and n*10 generated interactions"""
+    articles = generate_articles(n, seed=seed)
+    events = generate_histories(articles, n_users, n * 10, seed=seed)
+    texts = [a['title'] + ' ' + a['description'] for a in articles]
+    topic_model = TopicModeler()
+    topic_model.fit([])
+    store = ArticleFeatureStore(topic_model)
+    topics = store.topics(articles)
+    ctr_predictor = CTRPredictor()
+    labelled = events[:min(len(events), 20000)]
+    ctr_predictor.fit([e[3] for e in labelled], [int(e[2]) for e in labelled],
+                      user_ids=[e[0] for e in labelled], epochs=1)
+    scores = ctr_predictor.predict_proba(articles, user_id='user_0', topics=topics)
+    results = {}
+
+    def fresh_store():
+        return ArticleFeatureStore(topic_model)
+
+    def added_store():
+        cold = ArticleFeatureStore(topic_model)
+        cold.add(articles)
+        return cold
+
+    results['topic_transform'] = measure(lambda: topic_model.transform(texts), repeat, items=n)
+    results['feature_store_add'] = measure(lambda s: s.add(articles), repeat, setup=fresh_store, items=n)
+    results['tfidf_build'] = measure(lambda s: s.tfidf(articles), repeat, setup=added_store, items=n)
+    results['ctr_predict'] = measure(
+        lambda: ctr_predictor.predict_proba(articles, user_id='user_0', topics=topics), repeat, items=n)
+    batch = labelled[:100]
+    results['ctr_partial_fit_100'] = measure(
+        lambda: ctr_predictor.partial_fit([e[3] for e in batch], [int(e[2]) for e in batch],
+                                          [e[0] for e in batch]), repeat, items=len(batch))
+    tfidf = store.tfidf(articles)
+    results['mmr_select_10'] = measure(lambda: mmr_select(tfidf, scores, 0.5, 10), repeat, items=n)
+
+    # History backends: the interaction stream written in the TrainingWorker's batch size
+    def history_backend(kind):
+        path = os.path.join(workdir, f"{kind}_{n}_{time.perf_counter_ns()}")
+        if kind == 'sqlite':
+            return SQLiteUserHistory(path + '.db', feature_store=store)
+        return UserHistory(data_file=path + '.json', feature_store=store, compact_every=10 ** 9,
+                           compact_interval=10 ** 6)
+
+    def write_all(history):
+        for start in range(0, len(events), 100):
+            history.add_interactions(events[start:start + 100])
+        history.close()
+
+    results['history_add_json'] = measure(write_all, repeat, setup=lambda: history_backend('json'),
+                                          items=len(events))
+    results['history_add_sqlite'] = measure(write_all, repeat, setup=lambda: history_backend('sqlite'),
+                                            items=len(events))
+
+    history = history_backend('json')
+    history.add_interactions(events)
+    results['history_save'] = measure(history.save_history, repeat, items=len(events))
+    users = [f"user_{u}" for u in range(min(n_users, 1000))]
+    results['profile_lookup'] = measure(lambda: [history.get_profile(u) for u in users], repeat, items=len(users))
+
+    index = CandidateIndex(store)
+    index.sync(articles)
+    recommender = Recommender(topic_model, ctr_predictor, history, candidate_index=index)
+    recommender.recommend('user_0', articles)  # Warm caches, as a serving process would be
+    results['recommend'] = measure(lambda: recommender.recommend('user_0', articles), repeat, items=n)
+    history.close()
+    return {f"{name}[n={n}]": result for name, result in results.items()}
+
+
+def end_to_end(n_articles, n_users, requests, seed, workdir):
+    """Flask test-client run of /, /view and /click against a mock NewsAPI serving a generated corpus"""
+    articles = generate_articles(n_articles, seed=seed)
+    events = generate_histories(articles, n_users, n_users * 20, seed=seed)
+    rng = np.random.default_rng(seed)
+    latencies = {'home': [], 'view': [], 'click': []}
+    with MockNewsAPI(corpus=articles) as api:
+        os.environ.update({
+            'ML_ENABLED': '1', 'NEWS_API_URL': api.url, 'NEWS_API_KEY': 'bench',
+            'NEWS_PAGES': str(-(-n_articles // 100)), 'ARTICLE_POOL_TTL': '3600',
+            'TRAINING_FLUSH_SECONDS': '0.5', 'FEED_CACHE': os.path.join(workdir, 'feed_cache.json'),
+        })
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        log = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(log):
+                app_module = importlib.import_module('app')
+                app_module.user_history.add_interactions(events)
+                client = app_module.app.test_client()
+                client.get('/')  # First request fills the article pool
+                start = time.perf_counter()
+                for _ in range(requests):
+                    user_id = f"user_{(rng.zipf(1.3) - 1) % n_users}"
+                    with client.session_transaction() as session:
+                        session['user_id'] = user_id
+                    t = time.perf_counter()
+                    page = client.get('/').data.decode()
+                    latencies['home'].append(time.perf_counter() - t)
+                    ids = re.findall(r'/view/([0-9a-f]+)', page)
+                    if ids and rng.random() < 0.5:
+                        picked = ids[int(rng.integers(len(ids)))]
+                        t = time.perf_counter()
+                        client.get(f'/view/{picked}')
+                        latencies['view'].append(time.perf_counter() - t)
+                        if rng.random() < 0.3:
+                            t = time.perf_counter()
+                            client.get(f'/click/{picked}')
+                            latencies['click'].append(time.perf_counter() - t)
+                elapsed = time.perf_counter() - start
+                app_module.training_worker.join()
+                app_module.user_history.close()
+        finally:
+            os.chdir(cwd)
+
+    total = sum(len(samples) for samples in latencies.values())
+    results = {}
+    for endpoint, samples in latencies.items():
+        if samples:
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            results[f"http_{endpoint}[n={n_articles}]"] = {
+                'median_s': float(p50), 'p95_s': float(p95), 'p99_s': float(p99), 'requests': len(samples)}
+    results[f"http_throughput[n={n_articles}]"] = {'requests_per_s': total / elapsed, 'requests': total,
+                                                   'median_s': elapsed / total}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print current vs baseline times; returns the names that regressed by more than tolerance"""
+    regressions = []
+    print(f"{'benchmark':<40} {'baseline ms':>12} {'current ms':>11} {'ratio':>7}")
+    for name in sorted(set(results) & set(baseline)):
+        # Best-of-repeat is the least noisy figure for micro-benchmarks; HTTP runs only have medians
+        key = 'min_s' if 'min_s' in results[name] and 'min_s' in baseline[name] else 'median_s'
+        before = baseline[name][key]
+        after = results[name][key]
+        ratio = after / before if before else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<40} {before * 1000:>12.3f} {after * 1000:>11.3f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000, 10000], help="articles per corpus")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=200, help="end-to-end home page requests")
+    parser.add_argument('--e2e-articles', type=int, default=500)
+    parser.add_argument('--skip-e2e', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_suite_')
+    results = {}
+    try:
+        for n in args.scales:
+            print(f"Micro-benchmarks at n={n}...", file=sys.stderr)
+            results.update(micro(n, args.users, args.repeat, args.seed, workdir))
+        if not args.skip_e2e:
+            print(f"End-to-end run with {args.requests} requests...", file=sys.stderr)
+            results.update(end_to_end(args.e2e_articles, args.users, args.requests, args.seed, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
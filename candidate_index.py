@@ -0,0 +1,155 @@
+from datetime import datetime, timezone
+import itertools
+import math
+import threading
+
+from data_fetcher import article_id
+
+
+class CandidateIndex:
+    """Topic -> article posting lists over the article pool, for first-stage candidate retrieval
+
+    Each topic has two lists, newest first and highest prior first, and candidates are drawn from both
+    in turn. The prior is an article-only score, prior(articles, topics) -> one number per article; by
+    default how widely the story is syndicated. sync re-scores the whole pool with it.
+    """
+
+    def __init__(self, feature_store, explore=0.2, prior=None):
+        self.feature_store = feature_store
+        self.explore = explore  # Share of candidates picked whatever the profile
+        self.prior = prior or syndication_prior
+        self.articles = {}  # article_id: (published, topic, article)
+        self.topic_postings = {}  # topic: [(-published, article_id)], newest first
+        self.topic_priors = {}  # topic: [(-prior, -published, article_id)], highest prior first
+        self.recent = []  # Every article, newest first
+        self.ranked = []  # Every article, highest prior first
+        self.pool = None  # The articles last passed to sync, while the index matches them exactly
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.articles)
+
+    def add(self, articles):
+        new = {}
+        for article in articles:
+            key = article_id(article)
+            if key not in self.articles:
+                new[key] = article
+        if new:
+            self._index(new, rescore=False)
+
+    def remove(self, article_ids):
+        with self._lock:
+            removed = {}
+            for key in article_ids:
+                entry = self.articles.pop(key, None)
+                if entry is not None:
+                    removed[key] = entry[1]
+            if not removed:
+                return
+            # One linear filter per affected list, however many articles expired
+            for topic in set(removed.values()):
+                self.topic_postings[topic] = [p for p in self.topic_postings[topic] if p[-1] not in removed]
+                self.topic_priors[topic] = [p for p in self.topic_priors[topic] if p[-1] not in removed]
+            self.recent = [p for p in self.recent if p[-1] not in removed]
+            self.ranked = [p for p in self.ranked if p[-1] not in removed]
+
+    def sync(self, articles):
+        """Make the index match the given pool: expire what is gone, add what is new, re-score every prior"""
+        with self._lock:
+            self.pool = None
+        current = {article_id(a): a for a in articles}
+        self.remove([key for key in list(self.articles) if key not in current])
+        if current:
+            self._index(current, rescore=True)
+        with self._lock:
+            self.pool = articles
+
+    def _index(self, batch, rescore):
+        """Insert the new articles of batch; with rescore, batch is the whole index and every prior list is rebuilt"""
+        articles = list(batch.values())
+        topics = self.feature_store.topics(articles).tolist()
+        priors = [float(prior) for prior in self.prior(articles, topics)]
+        with self._lock:
+            touched = set()
+            for (key, article), topic in zip(batch.items(), topics):
+                entry = self.articles.get(key)
+                if entry is None:
+                    published = _published_ts(article)
+                    self.topic_postings.setdefault(topic, []).append((-published, key))
+                    self.recent.append((-published, key))
+                    touched.add(topic)
+                else:
+                    published = entry[0]
+                # The pool's latest copy, whose cluster_size may have grown
+                self.articles[key] = (published, topic, article)
+            # Timsort keeps the existing sorted prefix as one run: O(n + m log m) per batch of m
+            for topic in touched:
+                self.topic_postings[topic].sort()
+            self.recent.sort()
+
+            postings = [(-prior, -self.articles[key][0], key) for key, prior in zip(batch, priors)]
+            if rescore:
+                self.topic_priors = {topic: [] for topic in self.topic_postings}
+                self.ranked = []
+            for posting, topic in zip(postings, topics):
+                self.topic_priors.setdefault(topic, []).append(posting)
+                self.ranked.append(posting)
+            for topic in (self.topic_priors if rescore else touched):
+                self.topic_priors[topic].sort()
+            self.ranked.sort()
+
+    def candidates(self, profile, k, articles=None):
+        """Up to k articles: the best of each topic in proportion to the user's interest, then the best overall
+
+        Best alternates between newest and highest prior. With articles, only those are returned; that
+        costs a pass over them unless they are the synced pool.
+        """
+        interest = profile['interest'] if profile else []
+        total = sum(interest)
+        chosen = {}
+        with self._lock:
+            allowed = None
+            if articles is not None and articles is not self.pool:
+                allowed = {article_id(a) for a in articles}
+            if total > 0:
+                personal = k - int(k * self.explore)
+                for topic, weight in enumerate(interest):
+                    quota = math.ceil(personal * weight / total)
+                    postings = _merged(self.topic_postings.get(topic, []), self.topic_priors.get(topic, []), allowed)
+                    for key in itertools.islice(postings, quota):
+                        chosen.setdefault(key, self.articles[key][2])
+            for key in _merged(self.recent, self.ranked, allowed):
+                if len(chosen) >= k:
+                    break
+                chosen.setdefault(key, self.articles[key][2])
+        return list(chosen.values())[:k]
+
+
+def syndication_prior(articles, topics):
+    """Copies of each story in the pool, which the CTR model rewards"""
+    return [article.get('cluster_size') or 1 for article in articles]
+
+
+def _merged(newest, ranked, allowed):
+    """Article IDs in turn from a newest-first and a prior-ordered list, each once and only if in allowed"""
+    seen = set()
+    for pair in itertools.zip_longest(newest, ranked):
+        for posting in pair:
+            if posting is None:
+                continue
+            key = posting[-1]
+            if key not in seen and (allowed is None or key in allowed):
+                seen.add(key)
+                yield key
+
+
+def _published_ts(article):
+    try:
+        published = datetime.fromisoformat(article.get('publishedAt'))
+    except (TypeError, ValueError):
+        return 0.0
+    if published.tzinfo is None:
+        published = published.astimezone()  # Naive timestamps are local time
+    return published.astimezone(timezone.utc).timestamp()
+
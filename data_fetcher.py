@@ -1,33 +1,190 @@
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+import hashlib
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import metrics
+
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|ref|cmpid)$', re.IGNORECASE)
+
+
+def normalize_url(url):
+    """Canonical form of an article URL: no scheme/www/tracking params/fragment/trailing slash"""
+    parts = urlsplit((url or '').strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if not TRACKING_PARAMS.match(k)))
+    return urlunsplit(('', host, parts.path.rstrip('/'), query, '')).lstrip('/')
+
+
+def title_hash(title):
+    words = re.findall(r'\w+', (title or '').lower())
+    return hashlib.sha1(' '.join(words).encode('utf-8')).hexdigest() if words else None
+
+
+def article_id(article):
+    """Stable, content-derived article ID: a hash of the canonical URL (title when there is no URL)"""
+    if article.get('id'):
+        return article['id']
+    key = normalize_url(article.get('url')) or (article.get('title') or '')
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
 
 class NewsFetcher:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, base_url=None, max_workers=8, timeout=10, max_retries=4, backoff=0.5):
         self.api_key = api_key or "demo_key"  # Replace with your NewsAPI key
-        self.base_url = "https://newsapi.org/v2/"
+        self.base_url = base_url or "https://newsapi.org/v2/"
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # One pooled session shared by every worker thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._paused_until = 0.0  # Set on 429 so every worker backs off together
+        self._pause_lock = threading.Lock()
+        self._async_client = None  # httpx.AsyncClient, created on the event loop that first uses it
 
+    @metrics.timed('news_fetch_seconds', "NewsFetcher.fetch_news latency")
     def fetch_news(self, query="technology", days=7):
         if self.api_key != "demo_key":
             # Use real NewsAPI
-            params = {
-                'q': query,
-                'from': (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d'),
-                'sortBy': 'publishedAt',
-                'apiKey': self.api_key,
-                'pageSize': 20
-            }
-            response = requests.get(self.base_url + "everything", params=params)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('articles', [])
-            else:
-                print(f"Error fetching news: {response.status_code}")
+            try:
+                return self._fetch_page(query, days, page=1, page_size=20)
+            except requests.RequestException as e:
+                print(f"Error fetching news: {e}")
                 return self._get_mock_data()
         else:
             # Use mock data for demo
             return self._get_mock_data()
 
+    def iter_articles(self, queries, pages=1, page_size=100, days=7):
+        """Fetch every query x page concurrently, yielding articles as they arrive, minus duplicates
+
+        Like fetch_news, falls back to mock data when every page fails or comes back empty.
+        """
+        if self.api_key == "demo_key":
+            yield from self._dedupe(self._get_mock_data(), set(), set())
+            return
+        seen_urls, seen_titles = set(), set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = [executor.submit(self._fetch_page, query, days, page, page_size)
+                       for query in queries for page in range(1, pages + 1)]
+            for future in as_completed(futures):
+                try:
+                    articles = future.result()
+                except requests.RequestException as e:
+                    print(f"Error fetching news: {e}")
+                    continue
+                yield from self._dedupe(articles, seen_urls, seen_titles)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if not seen_urls:  # Every yielded article records its URL key here
+            print("No articles fetched, using mock data")
+            yield from self._dedupe(self._get_mock_data(), set(), set())
+
+    @metrics.timed('news_ingest_seconds', "NewsFetcher.ingest latency (all queries and pages)")
+    def ingest(self, queries, pages=1, page_size=100, days=7):
+        return list(self.iter_articles(queries, pages, page_size, days))
+
+    @metrics.timed('news_ingest_seconds')
+    async def ingest_async(self, queries, pages=1, page_size=100, days=7):
+        """ingest() as a coroutine: every query x page is awaited concurrently on one pooled async client"""
+        if self.api_key == "demo_key":
+            return list(self._dedupe(self._get_mock_data(), set(), set()))
+        import httpx  # Only the async serving mode needs it
+
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_workers, max_keepalive_connections=self.max_workers))
+        results = await asyncio.gather(*[self._fetch_page_async(query, days, page, page_size)
+                                         for query in queries for page in range(1, pages + 1)],
+                                       return_exceptions=True)
+        seen_urls, seen_titles = set(), set()
+        articles = []
+        for result in results:
+            if isinstance(result, (requests.RequestException, httpx.HTTPError)):
+                print(f"Error fetching news: {result}")
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            articles.extend(self._dedupe(result, seen_urls, seen_titles))
+        if not articles:
+            print("No articles fetched, using mock data")
+            return list(self._dedupe(self._get_mock_data(), set(), set()))
+        return articles
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _fetch_page(self, query, days, page, page_size):
+        params = self._params(query, days, page, page_size)
+        for attempt in range(self.max_retries + 1):
+            delay = self._paused_until - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            response = self.session.get(self.base_url + "everything", params=params, timeout=self.timeout)
+            if response.status_code == 200:
+                return response.json().get('articles', [])
+            self._backoff(response, attempt)
+
+    async def _fetch_page_async(self, query, days, page, page_size):
+        params = self._params(query, days, page, page_size)
+        for attempt in range(self.max_retries + 1):
+            delay = self._paused_until - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            response = await self._async_client.get(self.base_url + "everything", params=params)
+            if response.status_code == 200:
+                return response.json().get('articles', [])
+            self._backoff(response, attempt)
+
+    def _params(self, query, days, page, page_size):
+        return {
+            'q': query,
+            'from': (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d'),
+            'sortBy': 'publishedAt',
+            'apiKey': self.api_key,
+            'pageSize': page_size,
+            'page': page
+        }
+
+    def _backoff(self, response, attempt):
+        """Raise for a final or non-retryable status, else pause every fetch before the next attempt"""
+        if response.status_code != 429 and response.status_code < 500 or attempt == self.max_retries:
+            raise requests.HTTPError(f"NewsAPI returned {response.status_code}", response=response)
+        # Rate limited or upstream error: honour Retry-After, else exponential backoff with jitter
+        retry_after = response.headers.get('Retry-After', '')
+        delay = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt * (1 + random.random())
+        with self._pause_lock:
+            self._paused_until = max(self._paused_until, time.time() + delay)
+
+    def _dedupe(self, articles, seen_urls, seen_titles):
+        for article in articles:
+            url_key = normalize_url(article.get('url'))
+            title_key = title_hash(article.get('title'))
+            if (url_key and url_key in seen_urls) or (title_key and title_key in seen_titles):
+                continue
+            seen_urls.add(url_key)
+            seen_titles.add(title_key)
+            article['id'] = article_id(article)
+            yield article
+
     def _get_mock_data(self):
         return [
             {
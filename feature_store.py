@@ -0,0 +1,170 @@
+from array import array
+from collections import Counter
+import re
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from data_fetcher import article_id
+
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")  # Same tokens as sklearn's TfidfVectorizer
+
+
+def article_text(article):
+    return (article.get('title') or '') + ' ' + (article.get('description') or '')
+
+
+class ArticleFeatureStore:
+    """Text, topic and TF-IDF features computed once per article at ingestion
+
+    Holds at most max_articles articles: past that, the least recently used ones are evicted, so the
+    store and each TF-IDF rebuild stay bounded however many articles pass through it.
+    """
+
+    def __init__(self, topic_model, max_articles=50000):
+        self.topic_model = topic_model
+        self.max_articles = max_articles
+        self.vocabulary = {}  # term: column, grown as new articles arrive
+        self.rows = {}  # article_id: row
+        self.ids = []
+        self.texts = []
+        self._topics = array('i')
+        self._indptr = array('q', [0])
+        self._indices = array('i')
+        self._counts = array('f')
+        self._doc_freq = array('i')
+        self._last_used = np.zeros(0, dtype=np.int64)  # Per row, the _clock of its latest lookup
+        self._clock = 0
+        self._tfidf = None  # Normalised matrix, dropped whenever rows are added or evicted
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, articles):
+        """Ingest any unseen articles and return the row of every article
+
+        Rows are only valid until the store next evicts; use topics(), texts_for() and tfidf(), which
+        take the articles themselves, to read features.
+        """
+        with self._lock:
+            return self._rows(articles)
+
+    def topics(self, articles, cache=True):
+        """Topic per article; with cache=False, articles not in the store are classified without being added"""
+        if cache:
+            with self._lock:
+                return np.array([self._topics[row] for row in self._rows(articles)], dtype=np.int32)
+        with self._lock:
+            rows = [self.rows.get(article_id(a)) for a in articles]
+            topics = [None if row is None else self._topics[row] for row in rows]
+        missing = [i for i, topic in enumerate(topics) if topic is None]
+        if missing:
+            computed, _ = self.topic_model.transform([article_text(articles[i]) for i in missing])
+            for i, topic in zip(missing, computed):
+                topics[i] = int(topic)
+        return np.array(topics, dtype=np.int32)
+
+    def texts_for(self, articles, cache=True):
+        if not cache:
+            return [article_text(a) for a in articles]
+        with self._lock:
+            return [self.texts[row] for row in self._rows(articles)]
+
+    def tfidf(self, articles):
+        """L2-normalised TF-IDF rows, rebuilt from stored counts only when the stored articles changed"""
+        with self._lock:
+            return self._tfidf_rows(self._rows(articles))
+
+    def features(self, articles):
+        """(topics, tfidf) for articles, read together"""
+        with self._lock:
+            rows = self._rows(articles)
+            return np.array([self._topics[row] for row in rows], dtype=np.int32), self._tfidf_rows(rows)
+
+    def _rows(self, articles):
+        keys = [article_id(a) for a in articles]
+        new = {}
+        for key, article in zip(keys, articles):
+            if key not in self.rows and key not in new:
+                new[key] = article
+        if new:
+            self._ingest(new)
+        rows = np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        self._clock += 1
+        self._last_used[rows] = self._clock
+        if self.max_articles and len(self.ids) > self.max_articles:
+            # Evict down to 90% of the bound so compaction is paid once per many new articles
+            self._evict(len(self.ids) - int(self.max_articles * 0.9))
+            rows = np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        return rows
+
+    def _tfidf_rows(self, rows):
+        if self._tfidf is None:
+            self._tfidf = self._build_tfidf()
+        return self._tfidf[rows]
+
+    def _ingest(self, new):
+        texts = [article_text(a) for a in new.values()]
+        topics, _ = self.topic_model.transform(texts)
+        for key, text, topic in zip(new, texts, topics):
+            counts = Counter(TOKEN_PATTERN.findall(text.lower()))
+            for term, count in counts.items():
+                column = self.vocabulary.get(term)
+                if column is None:
+                    column = self.vocabulary[term] = len(self.vocabulary)
+                    self._doc_freq.append(0)
+                self._indices.append(column)
+                self._counts.append(count)
+                self._doc_freq[column] += 1
+            self._indptr.append(len(self._indices))
+            self.rows[key] = len(self.ids)
+            self.ids.append(key)
+            self.texts.append(text)
+            self._topics.append(int(topic))
+        self._last_used = np.concatenate([self._last_used, np.zeros(len(new), dtype=np.int64)])
+        self._tfidf = None
+
+    def _evict(self, count):
+        """Drop up to count least recently used articles, never those looked up by the current call"""
+        stale = np.flatnonzero(self._last_used < self._clock)
+        drop = stale[np.argsort(self._last_used[stale], kind='stable')[:count]]
+        if not len(drop):
+            return
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[drop] = False
+        indptr = np.array(self._indptr, dtype=np.int64)
+        lengths = np.diff(indptr)
+        kept_entries = np.repeat(keep, lengths)
+        indices = np.array(self._indices, dtype=np.int32)[kept_entries]
+        counts = np.array(self._counts, dtype=np.float32)[kept_entries]
+        # Terms no remaining article uses leave the vocabulary; the other columns are renumbered
+        doc_freq = np.bincount(indices, minlength=len(self.vocabulary))
+        used = doc_freq > 0
+        columns = (np.cumsum(used) - 1).astype(np.int32)
+        self.vocabulary = {term: int(columns[column]) for term, column in self.vocabulary.items() if used[column]}
+        self._indices = array('i', columns[indices].tobytes())
+        self._counts = array('f', counts.tobytes())
+        self._doc_freq = array('i', doc_freq[used].astype(np.int32).tobytes())
+        self._indptr = array('q', np.concatenate([[0], np.cumsum(lengths[keep])]).astype(np.int64).tobytes())
+        self._topics = array('i', np.array(self._topics, dtype=np.int32)[keep].tobytes())
+        self._last_used = self._last_used[keep]
+        self.ids = [key for key, kept in zip(self.ids, keep) if kept]
+        self.texts = [text for text, kept in zip(self.texts, keep) if kept]
+        self.rows = {key: row for row, key in enumerate(self.ids)}
+        self._tfidf = None
+
+    def _build_tfidf(self):
+        n_rows = len(self.ids)
+        counts = sparse.csr_matrix(
+            (np.array(self._counts, dtype=np.float64),
+             np.array(self._indices, dtype=np.int32),
+             np.array(self._indptr, dtype=np.int64)),
+            shape=(n_rows, len(self.vocabulary)))
+        # Smoothed IDF and L2 row norms, matching TfidfVectorizer's defaults
+        idf = np.log((1 + n_rows) / (1 + np.array(self._doc_freq, dtype=np.float64))) + 1
+        matrix = counts.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ matrix
@@ -0,0 +1,52 @@
+import json
+import os
+import threading
+
+
+class FeedCache:
+    """Precomputed feeds (ranked article IDs) per user, written by batch_feeds.py and read by home()"""
+
+    def __init__(self, path="feed_cache.json"):
+        self.path = path
+        self.pool_fingerprint = None  # Article pool the feeds were ranked against, for batch_feeds.py reruns
+        self.feeds = {}  # user_id: {'history_len': n, 'article_ids': [...]}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self, user_id, history_len, by_id, n=10):
+        """The first n cached articles still in the pool (by_id), or None if fewer remain or the user interacted since
+
+        The batch job ingests its own pool, which rarely matches the app's exactly, so feeds are served as
+        long as enough of their articles are still around rather than only for the identical pool.
+        """
+        self.reload()
+        entry = self.feeds.get(user_id)
+        if entry is None or entry['history_len'] != history_len:
+            return None
+        articles = [by_id[i] for i in entry['article_ids'] if i in by_id][:n]
+        if len(articles) < min(n, len(by_id)):
+            return None
+        return articles
+
+    def reload(self):
+        # One stat per call; the file is only parsed again after a batch run replaced it
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.pool_fingerprint = data['pool_fingerprint']
+            self.feeds = data['feeds']
+            self._mtime = mtime
+
+    def save(self, pool_fingerprint, feeds):
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'pool_fingerprint': pool_fingerprint, 'feeds': feeds}, f, separators=(',', ':'))
+        os.replace(tmp_file, self.path)
+        self.pool_fingerprint = pool_fingerprint
+        self.feeds = feeds
@@ -0,0 +1,161 @@
+import cProfile
+from functools import wraps
+import inspect
+import os
+import random
+import threading
+import time
+
+# METRICS_ENABLED=0 turns every timer into a single flag check
+enabled = os.environ.get('METRICS_ENABLED', '1') != '0'
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Summary:
+    """Count, sum and quantiles over a sliding window of the most recent observations"""
+
+    def __init__(self, window=2048):
+        self.count = 0
+        self.total = 0.0
+        self._window = [0.0] * window
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._window[self.count % len(self._window)] = value
+            self.count += 1
+            self.total += value
+
+    def quantiles(self):
+        with self._lock:
+            recent = sorted(self._window[:min(self.count, len(self._window))])
+        if not recent:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: recent[min(int(q * len(recent)), len(recent) - 1)] for q in QUANTILES}
+
+
+_summaries = {}  # (name, sorted label pairs): Summary
+_help = {}
+_registry_lock = threading.Lock()
+
+
+def describe(name, help_text):
+    _help[name] = help_text
+
+
+def summary(name, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    found = _summaries.get(key)
+    if found is None:
+        with _registry_lock:
+            found = _summaries.setdefault(key, Summary())
+    return found
+
+
+def observe(name, seconds, **labels):
+    summary(name, **labels).observe(seconds)
+
+
+class timer:
+    """Context manager recording the elapsed seconds of its block under name"""
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter() if enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def timed(name, help_text=None):
+    """Decorator recording each call's duration under name"""
+    if help_text:
+        describe(name, help_text)
+
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not enabled:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    summary(name).observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                summary(name).observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def render_prometheus():
+    """All summaries in the Prometheus text exposition format"""
+    lines = []
+    seen = set()
+    with _registry_lock:
+        items = sorted(_summaries.items())
+    for (name, labels), found in items:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} summary")
+        label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+        for q, value in found.quantiles().items():
+            lines.append(f'{name}{{{label_text + "," if label_text else ""}quantile="{q}"}} {value:.6f}')
+        suffix = f'{{{label_text}}}' if label_text else ''
+        lines.append(f"{name}_sum{suffix} {found.total:.6f}")
+        lines.append(f"{name}_count{suffix} {found.count}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _registry_lock:
+        _summaries.clear()
+
+
+class RequestProfiler:
+    """Opt-in cProfile of a random sample of requests; stats of the slow ones are dumped to out_dir"""
+
+    def __init__(self, threshold=1.0, sample_rate=0.01, out_dir="profiles"):
+        self.threshold = threshold  # Seconds
+        self.sample_rate = sample_rate
+        self.out_dir = out_dir
+        self.dumped = 0
+
+    def start(self):
+        if random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # Another profiler is already active on this thread
+        return profile
+
+    def stop(self, profile, elapsed, name):
+        profile.disable()
+        if elapsed < self.threshold:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{elapsed * 1000:.0f}ms.prof")
+        profile.dump_stats(path)
+        self.dumped += 1
+        print(f"Slow request {name} took {elapsed * 1000:.0f}ms, profile saved to {path}")
+        return path
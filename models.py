@@ -1,8 +1,15 @@
-from sklearn.linear_model import LogisticRegression
-from sklearn.feature_extraction.text import TfidfVectorizer
-import joblib
+from datetime import datetime
+from itertools import repeat
+import json
 import numpy as np
+from operator import contains
 import os
+from scipy import sparse
+import time
+
+from data_fetcher import article_id
+from feature_store import TOKEN_PATTERN, article_text
+import metrics
 
 class TopicModeler:
     def __init__(self, num_topics=5):
@@ -19,45 +26,300 @@ class TopicModeler:
         }
         return [f"Topic {i}: {', '.join(words)}" for i, words in self.keywords.items()]
 
+    @metrics.timed('topic_transform_seconds', "TopicModeler.transform latency")
     def transform(self, documents):
-        topics = []
-        for doc in documents:
-            doc_lower = doc.lower()
-            scores = []
-            for topic_id, keywords in self.keywords.items():
-                score = sum(1 for kw in keywords if kw in doc_lower)
-                scores.append(score)
-            topic = np.argmax(scores) if max(scores) > 0 else 0
-            topics.append(topic)
-        return topics, None
-
-    def save_model(self, path="models/topic_model.pkl"):
-        joblib.dump(self.keywords, path)
-
-    def load_model(self, path="models/topic_model.pkl"):
+        """Assign each document its best topic; also returns the docs x topics keyword-hit matrix"""
+        keywords, keyword_topics = self._compile()
+        docs = [doc.lower() for doc in documents]
+        # One C-level substring pass over the whole batch per distinct keyword
+        hits = np.zeros((len(docs), len(keywords)), dtype=np.int64)
+        for k, kw in enumerate(keywords):
+            hits[:, k] = np.fromiter(map(contains, docs, repeat(kw)), dtype=bool, count=len(docs))
+        scores = hits @ keyword_topics
+        topics = scores.argmax(axis=1)  # First topic wins ties; all-zero rows fall back to topic 0
+        return topics.tolist(), scores
+
+    def _compile(self):
+        # Rebuilt whenever self.keywords is replaced (fit, load_model)
+        if getattr(self, '_compiled_for', None) is not self.keywords:
+            unique = list(dict.fromkeys(kw for words in self.keywords.values() for kw in words))
+            columns = {kw: k for k, kw in enumerate(unique)}
+            keyword_topics = np.zeros((len(unique), len(self.keywords)), dtype=np.int64)
+            for t, words in enumerate(self.keywords.values()):
+                for kw in words:
+                    keyword_topics[columns[kw], t] += 1
+            self._compiled = (unique, keyword_topics)
+            self._compiled_for = self.keywords
+        return self._compiled
+
+    def save_model(self, path="models/topic_model.json"):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({str(topic): words for topic, words in self.keywords.items()}, f)
+
+    def load_model(self, path="models/topic_model.json"):
         if os.path.exists(path):
-            self.keywords = joblib.load(path)
+            with open(path) as f:
+                self.keywords = {int(topic): words for topic, words in json.load(f).items()}
+        elif os.path.exists(os.path.splitext(path)[0] + '.pkl'):
+            import joblib  # Only needed for models saved before the JSON format
+            self.keywords = joblib.load(os.path.splitext(path)[0] + '.pkl')
 
 class CTRPredictor:
-    def __init__(self):
-        self.avg_ctr = 0.1  # Default CTR
+    """Online logistic regression over hashed sparse features, trained by per-event SGD"""
+
+    RECENCY_BUCKETS = (6, 24, 72, 168)  # Article age thresholds in hours
 
-    def fit(self, X, y):
+    def __init__(self, n_features=2 ** 18, learning_rate=0.1, l2=1e-5, feature_cache_size=100000):
+        self.avg_ctr = 0.1  # Default CTR, also the prediction for unseen features
+        self.n_features = n_features
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.feature_cache_size = feature_cache_size
+        self.weights = np.zeros(n_features)
+        self.bias = _logit(self.avg_ctr)
+        self.n_seen = 0
+        self.n_clicks = 0
+        self._hasher = None  # Built on first use, so importing this module does not load sklearn
+        # (article ID, copies bucket) or text: hashed static features, so repeat feeds skip hashing
+        self._feature_cache = {}
+
+    def fit(self, X, y, user_ids=None, topics=None, epochs=5):
+        self.weights = np.zeros(self.n_features)
+        self.n_seen = self.n_clicks = 0
         if len(y) > 0:
             self.avg_ctr = np.mean(y)
+            self.bias = _logit(self.avg_ctr)
+            for _ in range(epochs):
+                self.partial_fit(X, y, user_ids, topics)
+            self.n_seen, self.n_clicks = len(y), int(np.sum(y))
         else:
             # Use mock training data
             mock_X = ["AI in healthcare", "Climate change news", "Stock market update", "Space exploration", "Education tech"]
             mock_y = [0.3, 0.2, 0.4, 0.1, 0.25]  # Mock CTR values
             self.avg_ctr = np.mean(mock_y)
+            self.bias = _logit(self.avg_ctr)
+
+    def partial_fit(self, X, y, user_ids=None, topics=None):
+        """One SGD step per event; only the weights of the events' own features are touched"""
+        features = self.featurize(X, user_ids, topics)
+        y = np.asarray(y, dtype=float)
+        for i in range(features.shape[0]):
+            start, end = features.indptr[i], features.indptr[i + 1]
+            columns = features.indices[start:end]
+            values = features.data[start:end]
+            gradient = _sigmoid(values @ self.weights[columns] + self.bias) - y[i]
+            self.weights[columns] -= self.learning_rate * (gradient * values + self.l2 * self.weights[columns])
+            self.bias -= self.learning_rate * gradient
+        self.n_seen += len(y)
+        self.n_clicks += int(y.sum())
+        if self.n_seen:
+            self.avg_ctr = self.n_clicks / self.n_seen
 
-    def predict_proba(self, X):
-        # Simple prediction: return average CTR for all
-        return np.full(len(X), self.avg_ctr)
+    def update_model(self, training_data, user_ids=None, topics=None):
+        """Train on new interactions only, given as (X, y) like UserHistory.get_training_data"""
+        X, y = training_data
+        if len(y) > 0:
+            self.partial_fit(X, y, user_ids, topics)
 
-    def save_model(self, path="models/ctr_model.pkl"):
-        joblib.dump(self.avg_ctr, path)
+    @metrics.timed('ctr_predict_seconds', "CTRPredictor.predict_proba latency")
+    def predict_proba(self, X, user_id=None, topics=None):
+        """Click probability for a batch of articles (or texts), in one sparse matrix-vector product"""
+        if len(X) == 0:
+            return np.zeros(0)
+        user_ids = [user_id] * len(X) if user_id is not None else None
+        return _sigmoid(self.featurize(X, user_ids, topics) @ self.weights + self.bias)
 
-    def load_model(self, path="models/ctr_model.pkl"):
-        if os.path.exists(path):
-            self.avg_ctr = joblib.load(path)
\ No newline at end of file
+    @metrics.timed('ctr_article_logits_seconds', "CTRPredictor.article_logits latency")
+    def article_logits(self, X, topics):
+        """The user-independent part of each article's logit, for predict_proba_users
+
+        (sum of the article's weighted features before row scaling, row scale once the user x topic
+        cross is added), so a user only contributes the cross weight of the article's topic.
+        """
+        features = self.featurize(X, None, topics)
+        counts = np.diff(features.indptr)
+        raw = (features @ self.weights) * np.sqrt(counts).clip(min=1)
+        return raw, 1 / np.sqrt(counts + 1)
+
+    def article_prior(self, X, topics):
+        """Each article's logit without any user x topic cross: how clickable it is for an unknown user"""
+        raw, scale = self.article_logits(X, topics)
+        return raw * scale
+
+    def predict_proba_users(self, article_logits, user_ids, topic_matrix):
+        """users x articles click probabilities from article_logits and a topics x articles one-hot matrix
+
+        Matches predict_proba(X, user_id, topics) for each user, up to hash collisions within a row.
+        """
+        raw, scale = article_logits
+        crosses = self.user_topic_weights(user_ids, topic_matrix.shape[0])
+        return _sigmoid((raw + crosses @ topic_matrix) * scale + self.bias)
+
+    def user_topic_weights(self, user_ids, n_topics):
+        """users x topics matrix of the weights of the user x topic cross features"""
+        names = [[f'user={user_id}|topic={topic}'] for user_id in user_ids for topic in range(n_topics)]
+        columns = self.hasher().transform(names).indices
+        return np.asarray(self.weights[columns]).reshape(len(user_ids), n_topics)
+
+    def featurize(self, X, user_ids=None, topics=None):
+        """Hashed features: text tokens, source, topic, recency and popularity buckets, user x topic crosses
+
+        Text, source and popularity columns are hashed once per article and cached; each call only adds
+        the recency bucket, topic and cross columns.
+        """
+        if len(X) == 0:
+            return sparse.csr_matrix((0, self.n_features))
+        cached = self._static_features(X)
+        every_row = np.arange(len(X))
+        rows = [np.repeat(every_row, [len(columns) for columns, _, _ in cached])]
+        columns = [np.concatenate([columns for columns, _, _ in cached])]
+        values = [np.concatenate([values for _, values, _ in cached])]
+
+        dated = np.flatnonzero([published is not None for _, _, published in cached])
+        if len(dated):
+            published = np.array([cached[i][2] for i in dated], dtype=float)
+            buckets = np.searchsorted(self.RECENCY_BUCKETS, (time.time() - published) / 3600, side='right')
+            buckets[np.isnan(published)] = len(self.RECENCY_BUCKETS) + 1
+            names = [f'age={b}' for b in range(len(self.RECENCY_BUCKETS) + 1)] + ['age=unknown']
+            rows.append(dated)
+            columns.append(self._columns(names)[buckets])
+            values.append(np.ones(len(dated)))
+        if topics is not None:
+            rows.append(every_row)
+            columns.append(self._columns([f'topic={topic}' for topic in topics]))
+            values.append(np.ones(len(X)))
+            if user_ids is not None:
+                rows.append(every_row)
+                columns.append(self._columns([f'user={u}|topic={t}' for u, t in zip(user_ids, topics)]))
+                values.append(np.ones(len(X)))
+
+        matrix = sparse.csr_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+            shape=(len(X), self.n_features))
+        matrix.sum_duplicates()
+        # Scale rows to unit length so long texts do not dominate the SGD step size
+        lengths = np.sqrt(np.diff(matrix.indptr)).clip(min=1)
+        matrix.data /= np.repeat(lengths, np.diff(matrix.indptr))
+        return matrix
+
+    def _static_features(self, X):
+        """(columns, counts, publish timestamp) per article or text, hashed on first sight
+
+        The timestamp is None for plain texts, which get no recency bucket, and NaN when unparseable.
+        """
+        keys = [item if isinstance(item, str) else (article_id(item), _copies_bucket(item)) for item in X]
+        cache = self._feature_cache
+        missing = {}
+        for key, item in zip(keys, X):
+            if key not in cache and key not in missing:
+                missing[key] = item
+        if missing:
+            names = []
+            for item in missing.values():
+                text = item if isinstance(item, str) else article_text(item)
+                features = ['w=' + token for token in dict.fromkeys(TOKEN_PATTERN.findall(text.lower()))]
+                if not isinstance(item, str):
+                    features.append('src=' + ((item.get('source') or {}).get('name') or ''))
+                    copies = _copies_bucket(item)
+                    if copies is not None:
+                        # Syndicated stories: how widely a story is carried, in log2 buckets
+                        features.append(f'copies={copies}')
+                names.append(features)
+            hashed = self.hasher().transform(names).tocsr()
+            for i, (key, item) in enumerate(missing.items()):
+                start, end = hashed.indptr[i], hashed.indptr[i + 1]
+                published = None if isinstance(item, str) else _published_timestamp(item.get('publishedAt'))
+                missing[key] = (hashed.indices[start:end], hashed.data[start:end], published)
+        # Read before the cache can be replaced below, which would drop the entries found in it
+        found = [cache.get(key) or missing[key] for key in keys]
+        if missing:
+            if len(cache) + len(missing) > self.feature_cache_size:
+                # Replaced rather than cleared, so concurrent callers keep reading the dict they hold
+                cache = self._feature_cache = {}
+            cache.update(missing)
+        return found
+
+    def _columns(self, names):
+        """Hashed column per feature name, each distinct name hashed once"""
+        distinct = list(dict.fromkeys(names))
+        hashed = dict(zip(distinct, self.hasher().transform([[name] for name in distinct]).indices.tolist()))
+        return np.fromiter((hashed[name] for name in names), dtype=np.int64, count=len(names))
+
+    def hasher(self):
+        if self._hasher is None:
+            from sklearn.feature_extraction import FeatureHasher
+            self._hasher = FeatureHasher(n_features=self.n_features, input_type='string', alternate_sign=False)
+        return self._hasher
+
+    def save_model(self, path="models/ctr_model"):
+        """Weights as a raw float32 .npy, so load_model can memory-map them, plus scalars as JSON"""
+        os.makedirs(path, exist_ok=True)
+        weights_file = os.path.join(path, 'weights.npy')
+        # Replaced, never rewritten in place: processes mapping the old file keep a consistent view
+        with open(weights_file + '.tmp', 'wb') as f:
+            np.save(f, np.asarray(self.weights, dtype=np.float32))
+        os.replace(weights_file + '.tmp', weights_file)
+        meta_file = os.path.join(path, 'meta.json')
+        with open(meta_file + '.tmp', 'w') as f:
+            json.dump({'avg_ctr': float(self.avg_ctr), 'bias': float(self.bias), 'n_features': self.n_features,
+                       'n_seen': self.n_seen, 'n_clicks': self.n_clicks}, f)
+        os.replace(meta_file + '.tmp', meta_file)
+
+    def load_model(self, path="models/ctr_model", mmap_mode='c'):
+        """Memory-map the weights: workers share the pages until they train ('c' is copy-on-write)"""
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            self._set_features(meta['n_features'])
+            self.weights = np.load(os.path.join(path, 'weights.npy'), mmap_mode=mmap_mode)
+            self.avg_ctr = meta['avg_ctr']
+            self.bias = meta['bias']
+            self.n_seen = meta['n_seen']
+            self.n_clicks = meta['n_clicks']
+        elif os.path.exists(path + '.pkl'):
+            self._load_pickle(path + '.pkl')
+
+    def _load_pickle(self, path):
+        # Models saved with joblib before the .npy format
+        import joblib
+        state = joblib.load(path)
+        if not isinstance(state, dict):
+            # Models saved before online training only held the average CTR
+            self.avg_ctr = state
+            self.bias = _logit(state)
+            return
+        self._set_features(state['n_features'])
+        self.weights = np.zeros(self.n_features)
+        self.weights[state['indices']] = state['weights']
+        self.avg_ctr = state['avg_ctr']
+        self.bias = state['bias']
+        self.n_seen = state['n_seen']
+        self.n_clicks = state['n_clicks']
+
+    def _set_features(self, n_features):
+        if n_features != self.n_features:
+            self.n_features = n_features
+            self._hasher = None
+            self._feature_cache = {}
+
+
+def _copies_bucket(article):
+    copies = article.get('cluster_size') or 1
+    return min(int(copies).bit_length(), 6) if copies > 1 else None
+
+
+def _published_timestamp(published_at):
+    try:
+        return datetime.fromisoformat(published_at).timestamp()  # Naive timestamps are local time
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _sigmoid(z):
+    return 1 / (1 + np.exp(-np.clip(z, -35, 35)))
+
+
+def _logit(p):
+    p = min(max(p, 1e-6), 1 - 1e-6)
+    return np.log(p / (1 - p))
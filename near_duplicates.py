@@ -0,0 +1,121 @@
+import threading
+import zlib
+
+import numpy as np
+
+from data_fetcher import article_id
+from feature_store import TOKEN_PATTERN
+
+_PRIME = (1 << 31) - 1  # Mersenne prime: a * x + b stays within uint64 for 31-bit a, b and 32-bit x
+
+
+class NearDuplicateIndex:
+    """MinHash + LSH banding over title/description shingles, clustering syndicated copies of a story
+
+    Incremental: articles already seen keep their cluster, new ones are signed and looked up in the
+    band buckets, so each article costs O(num_perm) however large the pool is.
+    """
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=2, threshold=0.5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands  # Pairs above ~(1/bands) ** (1/rows) Jaccard usually share a band
+        self.shingle_size = shingle_size
+        self.threshold = threshold  # Minimum estimated Jaccard similarity to join a cluster
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)[:, None]
+        self._signatures = {}  # article_id: signature
+        self._cluster = {}  # article_id: cluster id (the id of the first article seen in it)
+        self._buckets = [{} for _ in range(bands)]  # band: {band bytes: [article_ids]}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def dedupe(self, articles, prune=True):
+        """One representative per cluster, in input order, each with 'cluster_size' copies in articles
+
+        Representatives are annotated copies; the caller's article dicts are left untouched. With prune,
+        articles missing from this batch are forgotten, so the index tracks the current pool.
+        """
+        keys = [a.get('id') or article_id(a) for a in articles]
+        with self._lock:
+            new = [i for i, key in enumerate(keys) if key not in self._signatures]
+            if new:
+                signatures = self.signatures([articles[i] for i in new])
+                for i, signature in zip(new, signatures):
+                    self._insert(keys[i], signature.copy())  # Copies, so pruning frees them one by one
+            if prune:
+                current = set(keys)
+                self._forget([key for key in self._signatures if key not in current])
+            clusters = [self._cluster[key] for key in keys]
+
+        sizes = {}
+        for cluster in clusters:
+            sizes[cluster] = sizes.get(cluster, 0) + 1
+        kept = []
+        seen = set()
+        for article, key, cluster in zip(articles, keys, clusters):
+            if cluster in seen:
+                continue
+            seen.add(cluster)
+            kept.append(dict(article, id=key, cluster_size=sizes[cluster]))
+        return kept
+
+    def clusters(self, articles):
+        """Cluster id of each article, assigning new ones as dedupe would"""
+        self.dedupe(articles, prune=False)
+        with self._lock:
+            return [self._cluster[a.get('id') or article_id(a)] for a in articles]
+
+    def signatures(self, articles, chunk=2000):
+        """MinHash signature per article, as a len(articles) x num_perm uint32 matrix"""
+        result = np.empty((len(articles), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(articles), chunk):
+            shingle_sets = [self._shingles(a) for a in articles[start:start + chunk]]
+            lengths = np.array([len(s) for s in shingle_sets])
+            hashes = np.fromiter((h for s in shingle_sets for h in s), dtype=np.uint64, count=int(lengths.sum()))
+            # Every permutation applied to every shingle of the chunk at once, then a min per article
+            permuted = (self._a * hashes + self._b) % _PRIME
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            result[start:start + len(shingle_sets)] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return result
+
+    def _shingles(self, article):
+        tokens = TOKEN_PATTERN.findall(((article.get('title') or '') + ' ' + (article.get('description') or '')).lower())
+        if not tokens:
+            # Nothing to compare on: the article only matches itself
+            return {zlib.crc32((article.get('url') or article_id(article)).encode('utf-8'))}
+        k = min(self.shingle_size, len(tokens))
+        return {zlib.crc32(' '.join(tokens[i:i + k]).encode('utf-8')) for i in range(len(tokens) - k + 1)}
+
+    def _insert(self, key, signature):
+        band_keys = [signature[b * self.rows:(b + 1) * self.rows].tobytes() for b in range(self.bands)]
+        best, best_similarity = None, self.threshold
+        checked = set()
+        for band, band_key in enumerate(band_keys):
+            for other in self._buckets[band].get(band_key, ()):
+                if other in checked:
+                    continue
+                checked.add(other)
+                similarity = np.count_nonzero(self._signatures[other] == signature) / self.num_perm
+                if similarity >= best_similarity:
+                    best, best_similarity = self._cluster[other], similarity
+        self._signatures[key] = signature
+        self._cluster[key] = best if best is not None else key
+        for band, band_key in enumerate(band_keys):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+    def _forget(self, keys):
+        for key in keys:
+            signature = self._signatures.pop(key)
+            del self._cluster[key]
+            for band in range(self.bands):
+                band_key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+                bucket = self._buckets[band][band_key]
+                bucket.remove(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
@@ -1,68 +1,182 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+
+from feature_store import ArticleFeatureStore
+import metrics
+
+DENSE_SIMILARITY_MAX_ARTICLES = 2000  # recommend_many keeps an articles x articles float64 matrix up to this
 
 class Recommender:
-    def __init__(self, topic_model, ctr_predictor, user_history):
+    def __init__(self, topic_model, ctr_predictor, user_history, feature_store=None, candidate_index=None,
+                 num_candidates=2000):
         self.topic_model = topic_model
         self.ctr_predictor = ctr_predictor
         self.user_history = user_history
-        self.vectorizer = TfidfVectorizer(max_features=1000)
+        # Share the history's store so articles are only processed once across both
+        if feature_store is None:
+            feature_store = getattr(user_history, 'feature_store', None)
+        if feature_store is None:
+            feature_store = ArticleFeatureStore(topic_model)
+        self.feature_store = feature_store
+        # Optional retrieval stage: rank only num_candidates articles pulled from the index
+        self.candidate_index = candidate_index
+        self.num_candidates = num_candidates
 
     def recommend(self, user_id, articles, num_recommendations=10, diversity_lambda=0.5):
         if not articles:
             return []
 
-        # Get user preferences
-        user_topics = self.user_history.get_user_topics(user_id, self.topic_model)
+        # Get user preferences, read straight from the incrementally maintained profile when there is one
+        profile = self.user_history.get_profile(user_id)
+        user_topics = [] if profile else self.user_history.get_user_topics(user_id, self.topic_model)
+
+        # Two-stage: large pools are narrowed by the candidate index before any scoring. Candidates only
+        # come from the articles passed in, which may be mock data or a subset rather than the indexed pool
+        if self.candidate_index is not None and len(articles) > self.num_candidates:
+            articles = self.candidate_index.candidates(profile, self.num_candidates, articles) or articles
 
-        # Predict CTR for each article
-        article_texts = [a['title'] + ' ' + a['description'] for a in articles]
-        ctr_scores = self.ctr_predictor.predict_proba(article_texts)
+        # Features are computed once per article; repeat requests only look them up
+        topics, tfidf = self.feature_store.features(articles)
 
-        # Get topics for articles
-        topics, _ = self.topic_model.transform(article_texts)
+        # Predict CTR for each article: the user only adds their topic cross weights to the article logits
+        ctr_predictor = self.ctr_predictor  # The training worker may swap in a new model meanwhile
+        ctr_scores = ctr_predictor.predict_proba_users(ctr_predictor.article_logits(articles, topics), [user_id],
+                                                       _topic_matrix(topics))[0]
 
         # Content-based scores
-        content_scores = []
-        for topic in topics:
-            if topic in user_topics:
-                content_scores.append(1.0)
-            else:
-                content_scores.append(0.5)  # Some baseline
+        if profile:
+            # Baseline 0.5, rising to 1.0 for the user's strongest (recency-weighted) topic
+            interest = np.zeros(max(len(profile['interest']), int(topics.max()) + 1))
+            interest[:len(profile['interest'])] = profile['interest']
+            content_scores = 0.5 + 0.5 * interest[topics] / max(interest.max(), 1e-12)
+        else:
+            content_scores = []
+            for topic in topics:
+                if topic in user_topics:
+                    content_scores.append(1.0)
+                else:
+                    content_scores.append(0.5)  # Some baseline
 
         # Combine scores
         combined_scores = 0.7 * ctr_scores + 0.3 * np.array(content_scores)
 
         # Diversity-aware selection using MMR
-        recommendations = self._mmr_selection(article_texts, combined_scores, diversity_lambda, num_recommendations)
+        recommendations = self._mmr_selection(tfidf, combined_scores, diversity_lambda, num_recommendations)
 
         return [articles[i] for i in recommendations]
 
-    def _mmr_selection(self, texts, scores, lambda_param, num):
-        self.vectorizer.fit(texts)
-        tfidf_matrix = self.vectorizer.transform(texts)
-        
-        selected = []
-        remaining = list(range(len(texts)))
-
-        while len(selected) < num and remaining:
-            best_score = -np.inf
-            best_idx = None
-
-            for idx in remaining:
-                relevance = scores[idx]
-                diversity = 0
-                if selected:
-                    similarities = [cosine_similarity(tfidf_matrix[idx:idx+1], tfidf_matrix[s:s+1])[0][0] for s in selected]
-                    diversity = 1 - max(similarities)
-                mmr_score = lambda_param * relevance - (1 - lambda_param) * diversity
-                if mmr_score > best_score:
-                    best_score = mmr_score
-                    best_idx = idx
-
-            if best_idx is not None:
-                selected.append(best_idx)
-                remaining.remove(best_idx)
-
-        return selected
\ No newline at end of file
+    @metrics.timed('recommend_many_seconds', "Recommender.recommend_many latency")
+    def recommend_many(self, user_ids, articles, num_recommendations=10, diversity_lambda=0.5, candidate_pool=None,
+                       chunk_size=1000):
+        """recommend() for many users against one pool, as {user_id: articles}
+
+        Article features, TF-IDF and the user-independent part of the CTR scores are computed once. Each
+        chunk of users is scored against every article through users x topics matrices, then MMR
+        re-ranks each user's candidate_pool (default num_candidates) best articles. The whole pool is
+        scored, so the candidate index is not used: up to num_candidates articles the result equals
+        recommend(), and above that it is the exhaustive ranking recommend() approximates.
+        """
+        user_ids = list(user_ids)
+        if not articles:
+            return {user_id: [] for user_id in user_ids}
+        ctr_predictor = self.ctr_predictor  # The training worker may swap in a new model meanwhile
+        topics, tfidf = self.feature_store.features(articles)
+        topic_matrix = _topic_matrix(topics)
+        article_logits = ctr_predictor.article_logits(articles, topics)
+
+        # Pairwise similarity of the whole pool, once, while it is small enough to hold densely
+        similarity = (tfidf @ tfidf.T).toarray() if len(articles) <= DENSE_SIMILARITY_MAX_ARTICLES else None
+        pool = min(candidate_pool or self.num_candidates, len(articles))
+
+        recommendations = {}
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            ctr_scores = ctr_predictor.predict_proba_users(article_logits, chunk, topic_matrix)
+            content_scores = 0.5 + 0.5 * (self._preference_matrix(chunk, topic_matrix.shape[0]) @ topic_matrix)
+            combined_scores = 0.7 * ctr_scores + 0.3 * content_scores
+            # Each user's best articles, back in pool order, as mmr_select picks its candidate pool
+            candidates = np.sort(np.argsort(-combined_scores, axis=1, kind='stable')[:, :pool], axis=1)
+            for user_id, scores, user_candidates in zip(chunk, combined_scores, candidates):
+                # Only the rows of the picked articles are read, never a candidates x candidates matrix
+                if similarity is not None:
+                    selected = mmr_select_dense(similarity, scores[user_candidates], diversity_lambda,
+                                                num_recommendations, user_candidates)
+                else:
+                    selected = mmr_select(tfidf[user_candidates], scores[user_candidates], diversity_lambda,
+                                          num_recommendations)
+                recommendations[user_id] = [articles[i] for i in user_candidates[selected]]
+        return recommendations
+
+    def _preference_matrix(self, user_ids, n_topics):
+        """users x topics content preference in [0, 1], weighted as recommend() weighs topics"""
+        preferences = np.zeros((len(user_ids), n_topics))
+        for i, user_id in enumerate(user_ids):
+            profile = self.user_history.get_profile(user_id)
+            if profile:
+                # Relative to the user's strongest topic, so the decay to now cancels out
+                interest = np.asarray(profile['interest'], dtype=float)
+                if len(interest):
+                    preferences[i, :min(len(interest), n_topics)] = (interest / max(interest.max(), 1e-12))[:n_topics]
+            else:
+                topics = [t for t in self.user_history.get_user_topics(user_id, self.topic_model) if t < n_topics]
+                preferences[i, topics] = 1.0
+        return preferences
+
+    @metrics.timed('mmr_selection_seconds', "MMR diversity re-ranking latency")
+    def _mmr_selection(self, tfidf_matrix, scores, lambda_param, num, candidate_pool=None):
+        return mmr_select(tfidf_matrix, scores, lambda_param, num, candidate_pool)
+
+
+def _topic_matrix(topics):
+    """topics x articles one-hot matrix"""
+    matrix = np.zeros((int(topics.max()) + 1, len(topics)))
+    matrix[topics, np.arange(len(topics))] = 1.0
+    return matrix
+
+
+def mmr_select_dense(similarity, scores, lambda_param, num, candidates=None):
+    """mmr_select over a precomputed cosine similarity matrix, of the candidates (indices into it) when given"""
+    relevance = lambda_param * np.asarray(scores, dtype=float)
+    selected = []
+    available = np.ones(len(relevance), dtype=bool)
+    max_similarity = None
+    while len(selected) < min(num, len(relevance)):
+        if max_similarity is None:
+            mmr_scores = relevance.copy()
+        else:
+            mmr_scores = relevance - (1 - lambda_param) * (1 - max_similarity)
+        mmr_scores[~available] = -np.inf
+        best = int(np.argmax(mmr_scores))
+        selected.append(best)
+        available[best] = False
+        row = similarity[best] if candidates is None else similarity[candidates[best], candidates]
+        max_similarity = row if max_similarity is None else np.maximum(max_similarity, row)
+    return selected
+
+
+def mmr_select(tfidf_matrix, scores, lambda_param, num, candidate_pool=None):
+    """Greedy MMR over L2-normalised rows, optionally restricted to the candidate_pool most relevant"""
+    scores = np.asarray(scores, dtype=float)
+    candidates = np.arange(len(scores))
+    if candidate_pool is not None and candidate_pool < len(scores):
+        # Stable sort keeps the original order among equal scores, like the unfiltered scan
+        candidates = np.sort(np.argsort(-scores, kind='stable')[:candidate_pool])
+    tfidf_matrix = tfidf_matrix[candidates].tocsr()
+    relevance = lambda_param * scores[candidates]
+
+    selected = []
+    available = np.ones(len(candidates), dtype=bool)
+    max_similarity = None
+    while len(selected) < min(num, len(candidates)):
+        if max_similarity is None:
+            mmr_scores = relevance.copy()
+        else:
+            mmr_scores = relevance - (1 - lambda_param) * (1 - max_similarity)
+        mmr_scores[~available] = -np.inf
+        best = int(np.argmax(mmr_scores))
+        selected.append(best)
+        available[best] = False
+        # Rows are unit length, so one sparse product gives cosine similarity to the new pick
+        similarity = np.asarray((tfidf_matrix @ tfidf_matrix[best].T).todense()).ravel()
+        max_similarity = similarity if max_similarity is None else np.maximum(max_similarity, similarity)
+
+    return [int(candidates[i]) for i in selected]
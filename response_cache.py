@@ -0,0 +1,72 @@
+from collections import OrderedDict, namedtuple
+import hashlib
+import sys
+import threading
+
+CachedFeed = namedtuple('CachedFeed', 'pool_version history_len article_ids html etag size')
+
+
+class ResponseCache:
+    """Bounded LRU of each user's ranked feed and rendered home page, valid for one article pool version
+
+    Entries are also keyed on the user's history length, which every worker process reads from the
+    same history backend, so an interaction handled by any process retires the pages cached by all.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.cleared = 0  # Entries dropped by clear() when the pool is refreshed
+        self._entries = OrderedDict()  # user_id: CachedFeed, least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, user_id, pool_version, history_len):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry.pool_version != pool_version or entry.history_len != history_len:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+    def put(self, user_id, pool_version, history_len, article_ids, html):
+        etag = hashlib.sha1(html.encode('utf-8')).hexdigest()[:16]
+        size = len(html) + sys.getsizeof(user_id) + sum(sys.getsizeof(i) for i in article_ids) + 64 * len(article_ids)
+        entry = CachedFeed(pool_version, history_len, tuple(article_ids), html, etag, size)
+        with self._lock:
+            old = self._entries.pop(user_id, None)
+            if old is not None:
+                self.bytes -= old.size
+            if size > self.max_bytes:
+                return entry  # Too large to keep at all
+            self._entries[user_id] = entry
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self.cleared += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'cleared': self.cleared,
+        }
@@ -0,0 +1,206 @@
+from datetime import datetime
+import json
+import sqlite3
+import threading
+
+import metrics
+from user_history import add_click, decayed_profile, training_texts
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    article_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    clicked INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS interactions_user_time ON interactions (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS interactions_time ON interactions (timestamp);
+CREATE TABLE IF NOT EXISTS articles (
+    article_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+
+class SQLiteUserHistory:
+    """UserHistory stored in SQLite (WAL): shared by every worker process, constant memory per process"""
+
+    def __init__(self, db_file="user_data.db", feature_store=None, interest_half_life=7 * 24 * 3600, timeout=30):
+        self.db_file = db_file
+        self.feature_store = feature_store
+        self.interest_half_life = interest_half_life
+        self.timeout = timeout  # Seconds a writer waits for another process to commit
+        self._local = threading.local()  # One connection per thread
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+
+    def add_interaction(self, user_id, article_id, clicked=False, article_data=None, timestamp=None):
+        self.add_interactions([(user_id, article_id, clicked, article_data, timestamp)])
+
+    def add_interactions(self, events):
+        """Record a batch of (user_id, article_id, clicked, article_data, timestamp) events in one transaction"""
+        rows = []
+        articles = {}
+        clicks = []
+        for user_id, article_id, clicked, article_data, timestamp in events:
+            timestamp = timestamp or datetime.now().isoformat()
+            rows.append((user_id, str(article_id), timestamp, 1 if clicked else 0))
+            if article_data:
+                articles.setdefault(str(article_id), article_data)
+            if clicked:
+                clicks.append((user_id, str(article_id), timestamp))
+        # Topics are worked out before the write lock is taken. History articles never enter the
+        # feature store, which stays bounded by the pool however long the history grows
+        topics = {}
+        if clicks and self.feature_store is not None and articles:
+            ids = list(articles)
+            topics = dict(zip(ids, self.feature_store.topics(list(articles.values()), cache=False).tolist()))
+
+        db = self._db()
+        with db:
+            # IMMEDIATE takes the write lock up front, so concurrent writers queue instead of deadlocking
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany("INSERT INTO interactions (user_id, article_id, timestamp, clicked) VALUES (?, ?, ?, ?)",
+                           rows)
+            db.executemany("INSERT OR IGNORE INTO articles (article_id, data) VALUES (?, ?)",
+                           [(key, json.dumps(article, separators=(',', ':'))) for key, article in articles.items()])
+            if clicks and self.feature_store is not None:
+                self._update_profiles(db, clicks, topics)
+
+    def get_history(self, user_id, limit=None, offset=0):
+        """Interactions oldest first; limit/offset select one page of them"""
+        cursor = self._db().execute(
+            "SELECT article_id, timestamp, clicked FROM interactions WHERE user_id = ? "
+            "ORDER BY timestamp, seq LIMIT ? OFFSET ?",
+            (user_id, -1 if limit is None else limit, offset))
+        return [{'article_id': article_id, 'timestamp': timestamp, 'clicked': bool(clicked)}
+                for article_id, timestamp, clicked in cursor]
+
+    def history_length(self, user_id):
+        return self._db().execute("SELECT COUNT(*) FROM interactions WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def history_lengths(self):
+        return dict(self._db().execute("SELECT user_id, COUNT(*) FROM interactions GROUP BY user_id"))
+
+    def stats(self, user_id):
+        total, clicks, unique = self._db().execute(
+            "SELECT COUNT(*), COALESCE(SUM(clicked), 0), COUNT(DISTINCT article_id) FROM interactions "
+            "WHERE user_id = ?", (user_id,)).fetchone()
+        return {'total_views': total - clicks, 'total_clicks': clicks, 'unique_articles': unique}
+
+    def get_article(self, article_id):
+        row = self._db().execute("SELECT data FROM articles WHERE article_id = ?", (str(article_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_profile(self, user_id, now=None):
+        """Topic click counts and interest weights decayed to now, or None if the user has no profile"""
+        profile = self._load_profile(self._db(), user_id)
+        if profile is None:
+            return None
+        return decayed_profile(profile, now or datetime.now().timestamp(), self.interest_half_life)
+
+    def get_user_topics(self, user_id, topic_model):
+        profile = self._load_profile(self._db(), user_id)
+        if profile is not None:
+            return [topic for topic, count in enumerate(profile['topic_counts']) if count]
+        clicked_articles = [json.loads(data) for (data,) in self._db().execute(
+            "SELECT DISTINCT a.data FROM interactions i JOIN articles a ON a.article_id = i.article_id "
+            "WHERE i.user_id = ? AND i.clicked", (user_id,))]
+        if not clicked_articles:
+            return []
+        if self.feature_store is not None:
+            return list(set(self.feature_store.topics(clicked_articles, cache=False).tolist()))
+        topics, _ = topic_model.transform([a['title'] + ' ' + a['description'] for a in clicked_articles])
+        return list(set(topics))
+
+    def iter_training_data(self, batch_size=1000):
+        """Yield (texts, labels) chunks straight off a cursor, so memory stays O(batch_size)"""
+        cursor = self._db().execute(
+            "SELECT a.data, i.clicked FROM interactions i JOIN articles a ON a.article_id = i.article_id "
+            "ORDER BY i.seq")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield training_texts([json.loads(data) for data, _ in rows], self.feature_store), \
+                [clicked for _, clicked in rows]
+
+    def get_training_data(self):
+        """Extract training data for CTR prediction"""
+        texts = []
+        y = []
+        for chunk_texts, chunk_y in self.iter_training_data():
+            texts.extend(chunk_texts)
+            y.extend(chunk_y)
+        return texts, y
+
+    @metrics.timed('history_save_seconds', "UserHistory.save_history (compaction) latency")
+    def save_history(self):
+        # Every write is already durable; fold the WAL back into the database file
+        self._db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def load_history(self):
+        pass  # Nothing is held in memory
+
+    def import_history(self, user_history, batch_size=10000):
+        """Copy every interaction of a file-backed UserHistory into the database"""
+        events = []
+        for user_id, interactions in user_history.history.items():
+            for h in interactions:
+                events.append((user_id, h['article_id'], h['clicked'], user_history.get_article(h['article_id']),
+                               h['timestamp']))
+                if len(events) >= batch_size:
+                    self.add_interactions(events)
+                    events = []
+        if events:
+            self.add_interactions(events)
+
+    def close(self):
+        with self._connections_lock:
+            for db in self._connections:
+                db.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            db = sqlite3.connect(self.db_file, timeout=self.timeout, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; only the last commits can be lost on power cut
+            self._local.db = db
+            with self._connections_lock:
+                self._connections.append(db)
+        return db
+
+    def _load_profile(self, db, user_id):
+        row = db.execute("SELECT data FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _update_profiles(self, db, clicks, topics):
+        # Runs inside the write transaction, so the read-modify-write cannot race another process
+        profiles = {}
+        for user_id, article_id, timestamp in clicks:
+            topic = topics.get(article_id)
+            if topic is None:
+                article = self.get_article(article_id)
+                if article is None:
+                    continue
+                topic = topics[article_id] = int(self.feature_store.topics([article], cache=False)[0])
+            clicked_at = datetime.fromisoformat(timestamp).timestamp()
+            profile = profiles.get(user_id)
+            if profile is None:
+                profile = profiles[user_id] = self._load_profile(db, user_id) or {
+                    'topic_counts': [], 'interest': [], 'updated_at': clicked_at}
+            add_click(profile, topic, clicked_at, self.interest_half_life)
+        db.executemany("INSERT OR REPLACE INTO profiles (user_id, data) VALUES (?, ?)",
+                       [(user_id, json.dumps(profile, separators=(',', ':'))) for user_id, profile in profiles.items()])
@@ -0,0 +1,65 @@
+"""Run with: python -m pytest tests"""
+import os
+from datetime import datetime, timedelta
+
+from benchmarks.bench_candidates import simulate
+from benchmarks.generators import generate_articles
+from candidate_index import CandidateIndex
+from feature_store import ArticleFeatureStore
+from models import CTRPredictor, TopicModeler
+from recommender import Recommender
+from user_history import UserHistory
+
+
+def make_store():
+    topic_model = TopicModeler()
+    topic_model.fit([])
+    return ArticleFeatureStore(topic_model)
+
+
+def test_prior_reaches_old_articles():
+    # One fresh story and many newer ones, then an old story carried by many outlets
+    now = datetime.now()
+    articles = generate_articles(50, seed=1, now=now)
+    old = dict(articles[0], id='old', publishedAt=(now - timedelta(days=30)).isoformat(), cluster_size=8)
+    index = CandidateIndex(make_store(), explore=1.0)
+    index.sync(articles[1:] + [old])
+    assert 'old' in {a['id'] for a in index.candidates(None, 2)}
+
+
+def test_sync_rescores_priors():
+    articles = generate_articles(20, seed=2)
+    index = CandidateIndex(make_store(), explore=1.0)
+    index.sync(articles)
+    target = articles[5]['id']
+    index.sync([dict(a, cluster_size=20) if a['id'] == target else a for a in articles])
+    assert index.ranked[0][-1] == target
+
+
+def test_two_stage_recall_above_num_candidates(tmp_path):
+    # A pool 40x the candidates, as 100k articles are to the default NUM_CANDIDATES of 2000
+    pool_size, num_candidates, n_users = 20000, 500, 10
+    store = make_store()
+    topic_model = store.topic_model
+    history = UserHistory(data_file=os.path.join(tmp_path, 'user_data.json'), feature_store=store)
+    articles = generate_articles(pool_size, seed=42)
+    events = simulate(articles, n_users, 20000, seed=42)
+    sample = [e[3] for e in events]
+    ctr_predictor = CTRPredictor()
+    ctr_predictor.fit(sample, [int(e[2]) for e in events], user_ids=[e[0] for e in events],
+                      topics=store.topics(sample), epochs=2)
+    history.add_interactions(events)
+    index = CandidateIndex(store, prior=ctr_predictor.article_prior)
+    index.sync(articles)
+    exhaustive = Recommender(topic_model, ctr_predictor, history)
+    two_stage = Recommender(topic_model, ctr_predictor, history, candidate_index=index,
+                            num_candidates=num_candidates)
+
+    recall = 0.0
+    for u in range(n_users):
+        expected = {a['id'] for a in exhaustive.recommend(f"user_{u}", articles)}
+        got = {a['id'] for a in two_stage.recommend(f"user_{u}", articles)}
+        recall += len(expected & got) / len(expected)
+    history.close()
+    # Ordering by recency alone kept 0.59 of the exhaustive top 10 here
+    assert recall / n_users >= 0.75
@@ -0,0 +1,36 @@
+"""Run with: python -m pytest tests"""
+import json
+import os
+
+from feature_store import ArticleFeatureStore
+from models import TopicModeler
+from user_history import UserHistory
+
+
+def article(n, topic_words):
+    return {'title': f"{topic_words} story {n}", 'description': topic_words, 'url': f"https://example.com/{n}",
+            'publishedAt': '2025-01-01T00:00:00', 'source': {'name': 'Example'}}
+
+
+def test_migrates_original_snapshot(tmp_path):
+    # The original app's format: per-user lists of interactions, each with a full article copy and
+    # clicked set to 'view' or 'click' by app.py
+    data_file = os.path.join(tmp_path, 'user_data.json')
+    space, market = article(1, 'nasa mars space'), article(2, 'stock market economy')
+    with open(data_file, 'w') as f:
+        json.dump({'user_1': [
+            {'article_id': 0, 'timestamp': '2025-01-02T00:00:00', 'clicked': 'view', 'article_data': market},
+            {'article_id': 1, 'timestamp': '2025-01-02T00:01:00', 'clicked': 'view', 'article_data': space},
+            {'article_id': 1, 'timestamp': '2025-01-02T00:02:00', 'clicked': 'click', 'article_data': space},
+        ]}, f)
+    topic_model = TopicModeler()
+    topic_model.fit([])
+    history = UserHistory(data_file=data_file, feature_store=ArticleFeatureStore(topic_model))
+
+    assert history.stats('user_1') == {'total_views': 2, 'total_clicks': 1, 'unique_articles': 2}
+    assert [h['clicked'] for h in history.get_history('user_1')] == [False, False, True]
+    _, y = history.get_training_data()
+    assert y == [0, 0, 1]
+    # Only the click feeds the profile: space (topic 3), not the viewed market story
+    assert history.get_user_topics('user_1', topic_model) == [3]
+    history.close()
@@ -0,0 +1,143 @@
+from collections import namedtuple
+import copy
+from datetime import datetime
+import os
+import queue
+import threading
+import time
+
+Event = namedtuple('Event', 'enqueued_at user_id article_id clicked article_data timestamp')
+
+
+class TrainingWorker:
+    """Applies click/view events to history and the CTR model on a background thread"""
+
+    def __init__(self, user_history, ctr_predictor, batch_size=100, flush_interval=5.0,
+                 model_path="models/ctr_model"):
+        self.user_history = user_history
+        self.model = ctr_predictor  # Serving model, replaced by reference after every batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.model_path = model_path
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_batch_seconds = 0.0
+        self._shadow = None  # Training copy, made on first use; the two models swap roles after every batch
+        self._catch_up = []  # Updates the shadow missed while it was serving
+        self._queue = queue.Queue()
+        self._inflight_since = None
+        self._listeners = []
+        self._thread = None
+        self._save_lock = None  # Open lock file while this process is the one that saves the model
+
+    def on_model_update(self, callback):
+        """Register callback(model), called after each swap so the serving path picks up the new model"""
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, user_id, article_id, clicked=False, article_data=None):
+        now = time.time()
+        self._queue.put(Event(now, user_id, article_id, clicked, article_data,
+                              datetime.fromtimestamp(now).isoformat()))
+
+    def join(self):
+        """Block until every submitted event has been applied"""
+        self._queue.join()
+
+    def stats(self):
+        with self._queue.mutex:
+            oldest = self._queue.queue[0].enqueued_at if self._queue.queue else None
+        if self._inflight_since is not None:
+            oldest = self._inflight_since
+        return {
+            'queue_depth': self._queue.qsize(),
+            'lag_seconds': time.time() - oldest if oldest is not None else 0.0,
+            'processed': self.processed,
+            'batches': self.batches,
+            'errors': self.errors,
+            'last_batch_seconds': self.last_batch_seconds,
+            'model_saver': self._save_lock is not None,
+        }
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            self._inflight_since = batch[0].enqueued_at
+            deadline = batch[0].enqueued_at + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"Training batch failed: {e}")
+            finally:
+                self._inflight_since = None
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _elected_saver(self):
+        """Whether this process saves the model: of several worker processes, only the holder of the lock does
+
+        Otherwise each would rewrite model_path after its own batches and the last writer would win. The
+        lock is released when its holder exits, and the next process to train takes over.
+        """
+        if self._save_lock is not None:
+            return True
+        try:
+            import fcntl
+        except ImportError:
+            return True  # No flock (Windows), where the app runs as a single process
+        os.makedirs(os.path.dirname(self.model_path) or '.', exist_ok=True)
+        lock = open(self.model_path + '.lock', 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._save_lock = lock
+        return True
+
+    def _apply(self, batch):
+        start = time.perf_counter()
+        self.user_history.add_interactions(
+            [(e.user_id, e.article_id, e.clicked, e.article_data, e.timestamp) for e in batch])
+
+        # The retired model is only brought level now, a full batch after it stopped serving,
+        # so requests that were still scoring on it never see weights change underneath them
+        for training_data, user_ids, topics in self._catch_up:
+            self._shadow.update_model(training_data, user_ids=user_ids, topics=topics)
+        self._catch_up = []
+
+        labelled = [e for e in batch if e.article_data]
+        if labelled:
+            if self._shadow is None:
+                # Deferred until there is something to train, so idle workers keep sharing the loaded weights
+                self._shadow = copy.deepcopy(self.model)
+            training_data = ([e.article_data for e in labelled], [1 if e.clicked else 0 for e in labelled])
+            user_ids = [e.user_id for e in labelled]
+            # Topics feed the user x topic cross features that predict_proba scores personalisation on. Not
+            # cached: clicked articles may have left the pool, and would push live ones out of the store
+            feature_store = getattr(self.user_history, 'feature_store', None)
+            topics = feature_store.topics(training_data[0], cache=False) if feature_store is not None else None
+            self._shadow.update_model(training_data, user_ids=user_ids, topics=topics)
+            if self._elected_saver():
+                self._shadow.save_model(self.model_path)
+            # Swapping a single reference is atomic for readers of self.model and the listeners
+            self.model, self._shadow = self._shadow, self.model
+            self._catch_up.append((training_data, user_ids, topics))
+            for callback in self._listeners:
+                callback(self.model)
+
+        self.processed += len(batch)
+        self.batches += 1
+        self.last_batch_seconds = time.perf_counter() - start
@@ -1,60 +1,403 @@
+from array import array
 import json
 from datetime import datetime
+import glob
 import os
+import threading
+
+from data_fetcher import article_id as stable_article_id
+import metrics
+
+VIEW, CLICK = 0, 1  # Event codes stored per interaction
+
+
+class UserEvents:
+    """One user's interactions as parallel arrays: article index, epoch seconds and event code
+
+    Reads like the list of {'article_id', 'timestamp', 'clicked'} dicts it replaces, building each
+    dict on access; views, clicks and unique articles are counted as events are appended.
+    """
+    __slots__ = ('table', 'articles', 'times', 'events', 'clicks', 'seen')
+
+    def __init__(self, table):
+        self.table = table  # Shared article table: index -> article_id
+        self.articles = array('i')
+        self.times = array('q')
+        self.events = array('b')
+        self.clicks = 0
+        self.seen = set()  # Article indexes this user has interacted with
+
+    def append(self, index, timestamp, event):
+        self.articles.append(index)
+        self.times.append(timestamp)
+        self.events.append(event)
+        if event == CLICK:
+            self.clicks += 1
+        self.seen.add(index)
+
+    @property
+    def views(self):
+        return len(self.events) - self.clicks
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._interaction(j) for j in range(*i.indices(len(self.events)))]
+        return self._interaction(range(len(self.events))[i])
+
+    def __iter__(self):
+        for j in range(len(self.events)):
+            yield self._interaction(j)
+
+    def _interaction(self, j):
+        return {
+            'article_id': self.table[self.articles[j]],
+            'timestamp': datetime.fromtimestamp(self.times[j]).isoformat(),
+            'clicked': self.events[j] == CLICK
+        }
+
 
 class UserHistory:
-    def __init__(self, data_file="user_data.json"):
+    def __init__(self, data_file="user_data.json", log_file=None, compact_every=10000, compact_interval=300,
+                 feature_store=None, interest_half_life=7 * 24 * 3600, read_only=False):
         self.data_file = data_file
-        self.history = {}  # user_id: list of (article_id, timestamp, clicked, article_data)
+        # Read-only readers (e.g. batch_feeds.py) never log, compact or rotate the files the app writes
+        self.read_only = read_only
+        self.feature_store = feature_store
+        self.interest_half_life = interest_half_life  # Seconds for a click's weight in a profile to halve
+        # Interactions are appended to a JSON Lines log and periodically compacted into data_file
+        self.log_file = log_file or os.path.splitext(data_file)[0] + '.log'
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.history = {}  # user_id: UserEvents
+        self.articles = {}  # article_id: article, stored once however many interactions refer to it
+        self.article_table = []  # index: article_id, for every article any interaction refers to
+        self._article_index = {}  # article_id: index into article_table
+        self.profiles = {}  # user_id: topic counts and decayed interest per topic, updated per click
+        self.seq = 0  # sequence number of the last recorded interaction
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._compact_requested = threading.Event()
+        self._log = None
+        self._pending = 0  # interactions logged since the last snapshot
+        self._snapshot_size = 0
         self.load_history()
+        self._compactor = None
+        if not read_only:
+            self._compactor = threading.Thread(target=self._compaction_loop, daemon=True)
+            self._compactor.start()
+
+    def add_interaction(self, user_id, article_id, clicked=False, article_data=None, timestamp=None):
+        self.add_interactions([(user_id, article_id, clicked, article_data, timestamp)])
+
+    def add_interactions(self, events):
+        """Record a batch of (user_id, article_id, clicked, article_data, timestamp) events with one log write"""
+        if self.read_only:
+            raise RuntimeError("UserHistory was opened read-only")
+        records = []
+        with self._lock:
+            for user_id, article_id, clicked, article_data, timestamp in events:
+                timestamp = timestamp or datetime.now().isoformat()
+                clicked_at = epoch_seconds(timestamp)
+                self.seq += 1
+                self._append(user_id, article_id, clicked_at, clicked)
+                record = {'article_id': article_id, 'timestamp': timestamp, 'clicked': clicked,
+                          'seq': self.seq, 'user_id': user_id}
+                if article_data and article_id not in self.articles:
+                    # Article content is logged once, with the first interaction that sees it
+                    self.articles[article_id] = article_data
+                    record['article'] = article_data
+                if clicked:
+                    self._update_profile(user_id, article_id, clicked_at)
+                records.append(record)
+            self._append_log(records)
+            self._pending += len(records)
+            # Keep the log no larger than the snapshot so compaction stays amortized O(1) per event
+            if self._pending >= max(self.compact_every, self._snapshot_size):
+                self._compact_requested.set()
 
-    def add_interaction(self, user_id, article_id, clicked=False, article_data=None):
-        if user_id not in self.history:
-            self.history[user_id] = []
-        interaction = {
-            'article_id': article_id,
-            'timestamp': datetime.now().isoformat(),
-            'clicked': clicked,
-            'article_data': article_data  # Store article content for training
+    def get_history(self, user_id, limit=None, offset=0):
+        """Interactions oldest first, as dicts built on access; limit/offset select one page of them"""
+        history = self.history.get(user_id, [])
+        if limit is None and not offset:
+            return history
+        return history[offset:None if limit is None else offset + limit]
+
+    def history_length(self, user_id):
+        return len(self.history.get(user_id, []))
+
+    def history_lengths(self):
+        with self._lock:
+            return {user: len(events) for user, events in self.history.items()}
+
+    def stats(self, user_id):
+        events = self.history.get(user_id)
+        if events is None:
+            return {'total_views': 0, 'total_clicks': 0, 'unique_articles': 0}
+        return {
+            'total_views': events.views,
+            'total_clicks': events.clicks,
+            'unique_articles': len(events.seen)
         }
-        self.history[user_id].append(interaction)
-        self.save_history()
 
-    def get_history(self, user_id):
-        return self.history.get(user_id, [])
+    def get_article(self, article_id):
+        return self.articles.get(article_id)
+
+    def get_profile(self, user_id, now=None):
+        """Topic click counts and interest weights decayed to now, or None if the user has no profile"""
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            return None
+        return decayed_profile(profile, now or datetime.now().timestamp(), self.interest_half_life)
 
     def get_user_topics(self, user_id, topic_model):
-        history = self.get_history(user_id)
-        clicked_articles = [h for h in history if h['clicked']]
+        profile = self.profiles.get(user_id)
+        if profile is not None:
+            return [topic for topic, count in enumerate(profile['topic_counts']) if count]
+        events = self.history.get(user_id)
+        if events is None:
+            return []
+        clicked_ids = [self.article_table[index] for index, event in zip(events.articles, events.events)
+                       if event == CLICK]
+        clicked_articles = [self.articles[i] for i in clicked_ids if i in self.articles]
         if not clicked_articles:
             return []
         # Get topics from clicked articles
+        if self.feature_store is not None:
+            return list(set(self.feature_store.topics(clicked_articles, cache=False).tolist()))
         topics = []
-        for h in clicked_articles:
-            if h['article_data']:
-                text = h['article_data']['title'] + ' ' + h['article_data']['description']
-                topic, _ = topic_model.transform([text])
-                topics.extend(topic)
+        for article in clicked_articles:
+            text = article['title'] + ' ' + article['description']
+            topic, _ = topic_model.transform([text])
+            topics.extend(topic)
         return list(set(topics))  # Unique topics
 
     def get_training_data(self):
         """Extract training data for CTR prediction"""
-        X = []
+        articles = []
         y = []
-        for user, interactions in self.history.items():
-            for interaction in interactions:
-                if interaction['article_data']:
-                    # Features: title + description
-                    text = interaction['article_data']['title'] + ' ' + interaction['article_data']['description']
-                    X.append(text)
-                    y.append(1 if interaction['clicked'] else 0)
-        return X, y
+        for user, events in self.history.items():
+            for index, event in zip(events.articles, events.events):
+                article = self.articles.get(self.article_table[index])
+                if article:
+                    articles.append(article)
+                    y.append(1 if event == CLICK else 0)
+        return training_texts(articles, self.feature_store), y
 
+    @metrics.timed('history_save_seconds', "UserHistory.save_history (compaction) latency")
     def save_history(self):
-        with open(self.data_file, 'w') as f:
-            json.dump(self.history, f, indent=2)
+        """Compact the interaction log into a fresh snapshot of the full history"""
+        if self.read_only:
+            return
+        with self._compaction_lock:
+            with self._lock:
+                # Arrays are append-only, so their current lengths pin down the snapshot contents
+                lengths = {user: len(events) for user, events in self.history.items()}
+                n_articles = len(self.article_table)
+                articles = dict(self.articles)
+                profiles = {user: dict(profile, topic_counts=list(profile['topic_counts']),
+                                       interest=list(profile['interest']))
+                            for user, profile in self.profiles.items()}
+                seq = self.seq
+                self._rotate_log(seq)
+                self._pending = 0
+            snapshot = {user: {'articles': self.history[user].articles[:n].tolist(),
+                               'times': self.history[user].times[:n].tolist(),
+                               'events': self.history[user].events[:n].tolist()}
+                        for user, n in lengths.items()}
+            tmp_file = self.data_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump({'seq': seq, 'article_table': self.article_table[:n_articles], 'history': snapshot,
+                           'articles': articles, 'profiles': profiles}, f, separators=(',', ':'))
+            os.replace(tmp_file, self.data_file)
+            self._snapshot_size = sum(lengths.values())
+            for path, log_seq in self._rotated_logs():
+                if log_seq <= seq:
+                    os.remove(path)
 
     def load_history(self):
+        self.history = {}
+        self.articles = {}
+        self.article_table = []
+        self._article_index = {}
+        self.profiles = {}
+        self.seq = 0
+        legacy = {}
         if os.path.exists(self.data_file):
             with open(self.data_file, 'r') as f:
-                self.history = json.load(f)
\ No newline at end of file
+                data = json.load(f)
+            if 'article_table' in data:
+                self.articles = data['articles']
+                self.profiles = data['profiles']
+                self.seq = data['seq']
+                self.article_table = data['article_table']
+                self._article_index = {article_id: i for i, article_id in enumerate(self.article_table)}
+                indexes = list(self._article_index.values())  # One int object per article, shared by every user
+                for user_id, columns in data['history'].items():
+                    events = self.history[user_id] = UserEvents(self.article_table)
+                    events.articles = array('i', columns['articles'])
+                    events.times = array('q', columns['times'])
+                    events.events = array('b', columns['events'])
+                    events.clicks = events.events.count(CLICK)
+                    events.seen = {indexes[i] for i in events.articles}
+            elif 'seq' in data and isinstance(data.get('history'), dict):
+                # Snapshot of per-interaction dicts
+                legacy = data['history']
+                self.articles = data.get('articles', {})
+                self.profiles = data.get('profiles', {})
+                self.seq = data['seq']
+            else:
+                legacy = data  # Snapshot written before the interaction log existed
+        rebuild_profiles = not self.profiles
+        for user_id, interactions in legacy.items():
+            for interaction in interactions:
+                self._intern_article(interaction)
+                clicked_at = epoch_seconds(interaction['timestamp'])
+                clicked = legacy_clicked(interaction['clicked'])
+                self._append(user_id, interaction['article_id'], clicked_at, clicked)
+                if rebuild_profiles and clicked:
+                    # Snapshot predates profiles: build them once from the full history
+                    self._update_profile(user_id, interaction['article_id'], clicked_at)
+        self._snapshot_size = sum(len(events) for events in self.history.values())
+
+        # Replay whatever the snapshot does not cover yet
+        snapshot_seq = self.seq
+        log_files = [path for path, _ in self._rotated_logs()]
+        if os.path.exists(self.log_file):
+            log_files.append(self.log_file)
+        for path in log_files:
+            try:
+                f = open(path, 'r')
+            except FileNotFoundError:
+                continue  # A read-only reader racing the app's compaction; it sees those events next load
+            with f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write at the tail of the log
+                    if record['seq'] <= snapshot_seq:
+                        continue
+                    self.seq = max(self.seq, record['seq'])
+                    if 'article' in record:
+                        self.articles.setdefault(record['article_id'], record.pop('article'))
+                    self._intern_article(record)
+                    clicked_at = epoch_seconds(record['timestamp'])
+                    self._append(record['user_id'], record['article_id'], clicked_at, record['clicked'])
+                    if record['clicked']:
+                        self._update_profile(record['user_id'], record['article_id'], clicked_at)
+                    self._pending += 1
+
+    def _append(self, user_id, article_id, clicked_at, clicked):
+        index = self._article_index.get(article_id)
+        if index is None:
+            index = self._article_index[article_id] = len(self.article_table)
+            self.article_table.append(article_id)
+        events = self.history.get(user_id)
+        if events is None:
+            events = self.history[user_id] = UserEvents(self.article_table)
+        events.append(index, int(clicked_at), CLICK if clicked else VIEW)
+
+    def _update_profile(self, user_id, article_id, clicked_at):
+        article = self.articles.get(article_id)
+        if article is None or self.feature_store is None:
+            return
+        # History articles are classified without entering the store, so replaying a long history
+        # does not fill it (or evict the pool) with articles that left the pool long ago
+        topic = int(self.feature_store.topics([article], cache=False)[0])
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            profile = self.profiles[user_id] = {'topic_counts': [], 'interest': [], 'updated_at': clicked_at}
+        add_click(profile, topic, clicked_at, self.interest_half_life)
+
+    def _intern_article(self, interaction):
+        # Older snapshots and logs carried a full article copy and a feed position on every interaction
+        article_data = interaction.pop('article_data', None)
+        if article_data:
+            interaction['article_id'] = stable_article_id(article_data)
+            self.articles.setdefault(interaction['article_id'], article_data)
+
+    def close(self):
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
+
+    def _append_log(self, records):
+        if self._log is None:
+            self._log = open(self.log_file, 'a')
+        self._log.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+        self._log.flush()
+
+    def _rotate_log(self, seq):
+        # Events up to seq move aside until the snapshot that covers them is on disk
+        if self._log:
+            self._log.close()
+            self._log = None
+        if os.path.exists(self.log_file):
+            os.replace(self.log_file, f"{self.log_file}.{seq}")
+
+    def _rotated_logs(self):
+        logs = []
+        for path in glob.glob(glob.escape(self.log_file) + '.*'):
+            suffix = path.rsplit('.', 1)[1]
+            if suffix.isdigit():
+                logs.append((path, int(suffix)))
+        return sorted(logs, key=lambda log: log[1])
+
+    def _compaction_loop(self):
+        while True:
+            self._compact_requested.wait(self.compact_interval)
+            self._compact_requested.clear()
+            if not self._pending:
+                continue
+            try:
+                self.save_history()
+            except Exception as e:
+                print(f"History compaction failed: {e}")
+
+
+def epoch_seconds(timestamp):
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+def legacy_clicked(value):
+    """Whether a snapshot's 'clicked' field is a click: the original app stored 'view' or 'click' there"""
+    return value is True or value == 'click'
+
+
+def add_click(profile, topic, clicked_at, half_life):
+    """O(topics): decay the profile's interest to this click's time, then add the click"""
+    if clicked_at >= profile['updated_at']:
+        decay = 0.5 ** ((clicked_at - profile['updated_at']) / half_life)
+        profile['interest'] = [weight * decay for weight in profile['interest']]
+        profile['updated_at'] = clicked_at
+        weight = 1.0
+    else:
+        # Late event: discount it to the profile's current reference time instead
+        weight = 0.5 ** ((profile['updated_at'] - clicked_at) / half_life)
+    missing = topic + 1 - len(profile['topic_counts'])
+    if missing > 0:
+        profile['topic_counts'].extend([0] * missing)
+        profile['interest'].extend([0.0] * missing)
+    profile['topic_counts'][topic] += 1
+    profile['interest'][topic] += weight
+
+
+def decayed_profile(profile, now, half_life):
+    decay = 0.5 ** (max(now - profile['updated_at'], 0) / half_life)
+    return {
+        'topic_counts': list(profile['topic_counts']),
+        'interest': [weight * decay for weight in profile['interest']],
+        'updated_at': profile['updated_at']
+    }
+
+
+def training_texts(articles, feature_store=None):
+    if feature_store is not None:
+        # Looked up in the store when there, without adding historical articles to it
+        return feature_store.texts_for(articles, cache=False)
+    # Features: title + description
+    return [a['title'] + ' ' + a['description'] for a in articles]